@@ -0,0 +1,267 @@
+"""
+Headless HTTP API for the medical assistant pipeline.
+
+    python api_server.py                    (or: uvicorn api_server:app --host 0.0.0.0 --port 8000)
+
+    POST   /sessions                        -> {"session_id"}
+    POST   /sessions/{id}/chat              {"message"} -> {"response", "conversation_ended"}
+    POST   /sessions/{id}/end               -> clinical summary, retrieved data and medical report
+    GET    /sessions/{id}/summary
+    GET    /sessions/{id}/report
+    POST   /sessions/{id}/validation        {"report"} -> {"stored"}
+    DELETE /sessions/{id}
+    GET    /metrics                         per-stage latency (count, p50 / p95 / p99 ms)
+
+Requests are served on an asyncio event loop. Every blocking Bedrock / OpenSearch call runs on a
+bounded thread pool (API_MAX_WORKERS), so one process serves many sessions concurrently with a
+predictable number of in-flight model calls, while the turns of a single session are serialized.
+"""
+
+import os
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from session_store import SessionStore
+from telemetry import snapshot, start_span
+
+
+class SessionError(Exception):
+    """A request the session's state does not allow; anything else is a server error."""
+    status_code = 409
+
+
+class SessionNotFound(SessionError):
+    status_code = 404
+
+    def __init__(self, session_id):
+        super().__init__(f"Unknown or unfinished session {session_id}")
+
+
+class SessionEnded(SessionError):
+    def __init__(self, session_id):
+        super().__init__("Conversation already ended")
+
+
+class ChatRequest(BaseModel):
+    message: str
+
+
+class ValidationRequest(BaseModel):
+    report: str
+
+
+class PipelineService:
+    """Shared MedicalPipeline, the worker pool for its blocking calls and per-session locks."""
+    def __init__(self, max_workers: int = None):
+
+        self.max_workers = max_workers or int(os.getenv("API_MAX_WORKERS", 16))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="api-worker")
+
+        # session_id -> [asyncio.Lock, requests holding or waiting for it]; a plain dict, not a
+        # SessionStore, so a lock is never evicted while in use and goes once the last holder is done
+        self.locks = {}
+        self.ended = SessionStore(namespace="api_full_chat")  # session_id -> full chat of a finished conversation
+
+        self._pipeline = None
+        self._pipeline_lock = threading.Lock()
+
+    @property
+    def pipeline(self):
+        # built on first use from a worker thread: creates the clients and checks the index
+        with self._pipeline_lock:
+            if self._pipeline is None:
+                from test_medical_pipeline import MedicalPipeline
+                self._pipeline = MedicalPipeline()
+            return self._pipeline
+
+    async def run(self, fn, *args):
+        """Run a blocking call on the worker pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    @asynccontextmanager
+    async def session_lock(self, session_id):
+        # only used from the event loop thread, so the holder count needs no extra locking
+        entry = self.locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[session_id]
+
+    def get_result(self, session_id):
+        result = self.pipeline.session_results.get(session_id)
+        if result is None:
+            raise SessionNotFound(session_id)
+        return result
+
+    # -------------------- BLOCKING OPERATIONS (worker pool) --------------------
+    def chat_turn(self, session_id, message):
+        if session_id in self.ended or session_id in self.pipeline.session_results:
+            raise SessionEnded(session_id)
+
+        response, stop_chat, full_chat = self.pipeline.conversation_agent.chat(session_id, message)
+        if stop_chat:
+            self.ended[session_id] = full_chat
+
+        return {"session_id": session_id, "response": response, "conversation_ended": stop_chat}
+
+    def end_session(self, session_id):
+        """Finish the conversation (if the patient has not sent STOP yet) and generate the report."""
+        if session_id in self.pipeline.session_results:
+            return self.pipeline.session_results[session_id]
+
+        conversation_agent = self.pipeline.conversation_agent
+        full_chat = self.ended.get(session_id)
+        if full_chat is None:
+            if session_id not in conversation_agent.full_chat_session:
+                raise SessionNotFound(session_id)
+            _, _, full_chat = conversation_agent.chat(session_id, "stop")
+
+        if not full_chat:
+            raise SessionError("Conversation has no turns")
+
+        _, result = self.pipeline.generate_report(session_id, full_chat)
+
+        # the chat history is no longer needed once the report exists
+        conversation_agent.end_session(session_id)
+        self.ended.pop(session_id, None)
+        return result
+
+    def validate(self, session_id, report):
+        """Store the doctor's report in the knowledge base when it differs from the generated one."""
+        result = self.get_result(session_id)
+
+        stored = report.strip() != result["medical_report"].strip()
+        if stored:
+            self.pipeline.doc_validated_report.summarize_doctor_validated_report(report)
+
+        self.pipeline.session_results[session_id] = dict(result, validated_report=report.strip())
+        return {"session_id": session_id, "stored": stored}
+
+    def delete_session(self, session_id):
+        self.pipeline.conversation_agent.end_session(session_id)
+        for store in (self.ended, self.pipeline.session_results):
+            store.pop(session_id, None)
+
+    def stats(self):
+        stats = {"max_workers": self.max_workers, "sessions": [self.ended.stats()], "active_sessions": len(self.locks)}
+        if self._pipeline is not None:
+            stats["sessions"] += self._pipeline.conversation_agent.session_store_stats()
+            stats["sessions"].append(self._pipeline.session_results.stats())
+            stats["prompt_cache"] = self._pipeline.conversation_agent.prompt_cache_stats()
+        return stats
+
+
+service = PipelineService()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if os.getenv("API_WARMUP", "false").lower() == "true":
+        await service.run(lambda: service.pipeline)
+    yield
+    service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="AI Medical Assistant API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # one stage per route template, so session ids do not split the histograms
+    request_span = start_span("http", method=request.method)
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        request_span.end(f"{type(e).__name__}: {e}")
+        raise
+    route = request.scope.get("route")
+    request_span.name = f"http {request.method} {route.path if route else 'unmatched'}"
+    request_span.set(status_code=response.status_code)
+    request_span.end()
+    return response
+
+
+async def call(session_id, fn, *args):
+    """Run a session operation on the worker pool, one at a time per session."""
+    async with service.session_lock(session_id):
+        try:
+            return await service.run(fn, session_id, *args)
+        except SessionError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/stats")
+async def stats():
+    return service.stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    return snapshot()
+
+
+@app.post("/sessions")
+async def create_session():
+    return {"session_id": str(uuid.uuid4())}
+
+
+@app.post("/sessions/{session_id}/chat")
+async def chat(session_id: str, request: ChatRequest):
+    if not request.message.strip():
+        raise HTTPException(status_code=422, detail="Message must be a non-empty string")
+    return await call(session_id, service.chat_turn, request.message)
+
+
+@app.post("/sessions/{session_id}/end")
+async def end_session(session_id: str):
+    return await call(session_id, service.end_session)
+
+
+@app.get("/sessions/{session_id}/summary")
+async def get_summary(session_id: str):
+    result = await call(session_id, service.get_result)
+    return {"session_id": session_id, "clinical_summary": result["clinical_summary"]}
+
+
+@app.get("/sessions/{session_id}/report")
+async def get_report(session_id: str):
+    result = await call(session_id, service.get_result)
+    return {
+        "session_id": session_id,
+        "medical_report": result["medical_report"],
+        "validated_report": result.get("validated_report"),
+    }
+
+
+@app.post("/sessions/{session_id}/validation")
+async def validate(session_id: str, request: ValidationRequest):
+    return await call(session_id, service.validate, request.report)
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await call(session_id, service.delete_session)
+    return {"session_id": session_id, "deleted": True}
+
+
+if __name__ == "__main__":
+
+    import uvicorn
+
+    # a single event-loop process; concurrency comes from the API_MAX_WORKERS thread pool
+    uvicorn.run(app, host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", 8000)))
@@ -1,10 +1,15 @@
 import streamlit as st
 import uuid
-from conversation_agent import ConversationAgent
-from chat_summary_agent import ChatSummaryAgent
-from retrieval_agent import MedicalDataRetrieval
-from report_generator_agent import ReportGeneratorAgent
-from doctor_validation import SummarizeValidatedReport
+import itertools
+import os
+
+from telemetry import start_span
+
+# run retrieval on the patient turns while the final summary is generated
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+
+# single pass: retrieval on the patient turns, then the summary and the report from one LLM call
+FUSED_REPORT = os.getenv("REPORT_MODE", "two_call") == "fused"
 
 # Page configuration
 st.set_page_config(
@@ -13,19 +18,57 @@ st.set_page_config(
     layout="wide"
 )
 
+# one telemetry span per script run; st.rerun() stops the run early, so it goes through rerun()
+script_run = start_span("streamlit_rerun")
+
+def end_script_run():
+    script_run.set(processing_stage=st.session_state.get("processing_stage"))
+    script_run.end()
+
+def rerun():
+    end_script_run()
+    st.rerun()
+
+# Process-wide agents, built on first use and shared by every session (per-session
+# state lives in st.session_state or is keyed by session_id inside the agent).
+# Agent modules are imported inside the getters so langchain / boto3 / OpenSearch load on the
+# first request instead of delaying the first page render.
+@st.cache_resource(show_spinner=False)
+def get_retrieval_agent():
+    from retrieval_agent import MedicalDataRetrieval
+    return MedicalDataRetrieval()
+
+@st.cache_resource(show_spinner=False)
+def get_conversation_agent():
+    from conversation_agent import ConversationAgent
+    # retrieval agent enables the rolling per-turn prefetch (PREFETCH_EVERY_N_TURNS)
+    if int(os.getenv("PREFETCH_EVERY_N_TURNS", 0)):
+        return ConversationAgent(retrieval_agent=get_retrieval_agent())
+    return ConversationAgent()
+
+@st.cache_resource(show_spinner=False)
+def get_summary_agent():
+    from chat_summary_agent import ChatSummaryAgent
+    return ChatSummaryAgent()
+
+@st.cache_resource(show_spinner=False)
+def get_report_generator():
+    from report_generator_agent import ReportGeneratorAgent
+    return ReportGeneratorAgent()
+
+@st.cache_resource(show_spinner=False)
+def get_summarize_validated_report():
+    from doctor_validation import SummarizeValidatedReport
+    return SummarizeValidatedReport()
+
+@st.cache_resource(show_spinner=False)
+def get_speculative_retrieval():
+    from speculative_retrieval import SpeculativeRetrieval
+    return SpeculativeRetrieval(get_retrieval_agent(), get_summary_agent())
+
 # Initialize session state
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
-if 'conversation_agent' not in st.session_state:
-    st.session_state.conversation_agent = ConversationAgent()
-if 'summary_agent' not in st.session_state:
-    st.session_state.summary_agent = ChatSummaryAgent()
-if 'retrieval_agent' not in st.session_state:
-    st.session_state.retrieval_agent = MedicalDataRetrieval()
-if 'report_generator' not in st.session_state:
-    st.session_state.report_generator = ReportGeneratorAgent()
-if 'summarize_validated_report' not in st.session_state:
-    st.session_state.summarize_validated_report = SummarizeValidatedReport()
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'conversation_ended' not in st.session_state:
@@ -71,12 +114,10 @@ with st.sidebar:
     """)
     
     if st.button("🔄 Start New Conversation", use_container_width=True):
+        # release the finished session's history; the shared agents are kept
+        if st.session_state.messages:
+            get_conversation_agent().end_session(st.session_state.session_id)
         st.session_state.session_id = str(uuid.uuid4())
-        st.session_state.conversation_agent = ConversationAgent()
-        st.session_state.summary_agent = ChatSummaryAgent()
-        st.session_state.retrieval_agent = MedicalDataRetrieval()
-        st.session_state.report_generator = ReportGeneratorAgent()
-        st.session_state.summarize_validated_report = SummarizeValidatedReport()
         st.session_state.messages = []
         st.session_state.conversation_ended = False
         st.session_state.chat_summary = None
@@ -89,7 +130,7 @@ with st.sidebar:
         st.session_state.doctor_action_taken = False
         st.session_state.validated_text_ses = False
         st.session_state.edited_report = None
-        st.rerun()
+        rerun()
 
     st.info("💡Send **‘stop’** in the chat to end the conversation!")
 
@@ -105,7 +146,7 @@ with st.sidebar:
         st.info("⏳ Conversation Not Started")
     
     # Clinical summary status
-    if st.session_state.processing_stage == 'summary':
+    if st.session_state.processing_stage in ('summary', 'fused_report'):
         st.warning("🔄 Generating Chat Summary...")
     elif st.session_state.chat_summary:
         st.success("✅ Chat Summary Generated")
@@ -121,7 +162,7 @@ with st.sidebar:
         st.info("⏳ Medical Data Retrieval Pending")
     
     # Report status
-    if st.session_state.processing_stage == 'report':
+    if st.session_state.processing_stage in ('report', 'fused_report'):
         st.warning("🏥 Generating Medical Report...")
     elif st.session_state.report_generated:
         st.success("✅ Medical Report Generated")
@@ -173,35 +214,65 @@ if not st.session_state.conversation_ended:
         with st.chat_message("user"):
             st.markdown(f"**You:** {prompt}")
         
-        # Get AI response
+        # Get AI response, rendered token by token as Bedrock produces it
         with st.chat_message("assistant"):
-            with st.spinner("🤔 **Thinking...**"):
-                response, conversation_ended, full_chat = st.session_state.conversation_agent.chat(
-                    st.session_state.session_id, prompt
-                )
-                
-                # Display AI response
-                st.markdown(f"**Assistant:** {response}")
-                
-                # Add AI response to messages
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                
-                # Handle conversation end
-                if conversation_ended :
-                    st.session_state.conversation_ended = True
-                    st.session_state.full_chat = full_chat
-                    st.session_state.processing_stage = 'summary'
-                    print("st.session_state.full_chat", st.session_state.full_chat)
-                    st.rerun()
+            st.write_stream(itertools.chain(
+                ["**Assistant:** "],
+                get_conversation_agent().chat_stream(st.session_state.session_id, prompt)
+            ))
+            response, conversation_ended, full_chat = get_conversation_agent().pop_stream_result(
+                st.session_state.session_id
+            )
+            
+            # Add AI response to messages
+            st.session_state.messages.append({"role": "assistant", "content": response})
+            
+            # Handle conversation end
+            if conversation_ended :
+                st.session_state.conversation_ended = True
+                st.session_state.full_chat = full_chat
+                st.session_state.processing_stage = 'summary'
+                print("st.session_state.full_chat", st.session_state.full_chat)
+                rerun()
+
+# Step 1 (single pass): retrieve on the conversation, summary and report follow in one call
+if st.session_state.processing_stage == 'summary' and FUSED_REPORT:
+    with st.spinner("🔍 **Retrieving Medical Information...**", show_time=True):
+        retrieved_data = get_speculative_retrieval().retrieve_on_conversation(
+            st.session_state.full_chat,
+            candidates=get_conversation_agent().pop_prefetched_candidates(st.session_state.session_id),
+            checkpoint=get_conversation_agent().get_summary_checkpoint(st.session_state.session_id)
+        )
+        st.session_state.retrieved_data = retrieved_data
+        st.session_state.processing_stage = 'fused_report'
+        print("st.session_state.retrieved_data", st.session_state.retrieved_data)
+        rerun()
 
 # Step 1: Set chat summary and show processing
+if st.session_state.processing_stage == 'summary' and SPECULATIVE_RETRIEVAL:
+    with st.spinner("🔍 **Generating Chat Summary & Retrieving Medical Information...**", show_time=True):
+        chat_summary, retrieved_data = get_speculative_retrieval().summarize_and_retrieve(
+            st.session_state.full_chat,
+            candidates=get_conversation_agent().pop_prefetched_candidates(st.session_state.session_id),
+            checkpoint=get_conversation_agent().get_summary_checkpoint(st.session_state.session_id)
+        )
+        st.session_state.chat_summary = chat_summary
+        st.session_state.retrieved_data = retrieved_data
+        st.session_state.processing_stage = 'report'
+        print("st.session_state.full_chat", st.session_state.chat_summary)
+        print("st.session_state.retrieved_data", st.session_state.retrieved_data)
+        rerun()
+
 if st.session_state.processing_stage == 'summary':
     with st.spinner("🔍 **Generating Chat Summary...**", show_time=True):
-        chat_summary = st.session_state.summary_agent.generate_chat_summary(st.session_state.full_chat)
+        chat_summary = get_summary_agent().generate_chat_summary(
+            st.session_state.full_chat,
+            checkpoint=get_conversation_agent().get_summary_checkpoint(st.session_state.session_id)
+        )
         st.session_state.chat_summary = chat_summary
         st.session_state.processing_stage = 'retrieval'
         print("st.session_state.full_chat", st.session_state.chat_summary)
-        st.rerun()
+        rerun()
 
 # Clinical Summary Section
 if st.session_state.chat_summary:
@@ -219,29 +290,68 @@ if st.session_state.chat_summary:
 # Step 2: Retrieve medical data
 if st.session_state.processing_stage == 'retrieval':
     with st.spinner("🔍 **Retrieving Medical Information...**", show_time=True):
-        retrieved_data = st.session_state.retrieval_agent.retrieve_data(st.session_state.chat_summary)
+        # answer from the candidates prefetched during the conversation when they are exact
+        prefetched = get_conversation_agent().pop_prefetched_candidates(st.session_state.session_id)
+        if prefetched is not None:
+            retrieved_data = get_speculative_retrieval().retrieve_from_candidates(
+                st.session_state.chat_summary, prefetched
+            )
+        else:
+            retrieved_data = get_retrieval_agent().retrieve_data(st.session_state.chat_summary)
         st.session_state.retrieved_data = retrieved_data
         st.session_state.processing_stage = 'report'
         print("st.session_state.retrieved_data", st.session_state.retrieved_data)
-        st.rerun()
+        rerun()
 
 # Step 3: Generate medical report with retrieved data
 if st.session_state.processing_stage == 'report':
-    with st.spinner("🏥 **Generating Medical Report...**", show_time=True):
-        medical_report = st.session_state.report_generator.generate_final_medical_report(
+    st.markdown("---")
+    st.subheader("🏥 Generating Medical Report...")
+    medical_report = st.write_stream(
+        get_report_generator().generate_final_medical_report_stream(
             full_chat=st.session_state.full_chat,
             chat_summary=st.session_state.chat_summary,
             retrieved_knowledge=st.session_state.retrieved_data
         )
+    )
+
+    st.session_state.medical_report = medical_report
+    st.session_state.report_generated = True
+
+    st.session_state.processing_stage = 'doctor_validation_stage'
+    print("st.session_state.medical_report", st.session_state.medical_report)
+
+    # Final rerun to show everything
+    rerun()
+
+# Step 2 (single pass): stream the report, the summary section is kept aside
+if st.session_state.processing_stage == 'fused_report':
+    st.markdown("---")
+    st.subheader("🏥 Generating Medical Report...")
+    fused = {}
+    st.write_stream(
+        get_report_generator().generate_summary_and_report_stream(
+            full_chat=st.session_state.full_chat,
+            retrieved_knowledge=st.session_state.retrieved_data,
+            result=fused
+        )
+    )
 
-        st.session_state.medical_report = medical_report
-        st.session_state.report_generated = True
+    chat_summary = fused["clinical_summary"]
+    if chat_summary is None:
+        with st.spinner("🔍 **Generating Chat Summary...**", show_time=True):
+            chat_summary = get_summary_agent().generate_chat_summary(
+                st.session_state.full_chat,
+                checkpoint=get_conversation_agent().get_summary_checkpoint(st.session_state.session_id)
+            )
 
-        st.session_state.processing_stage = 'doctor_validation_stage'
-        print("st.session_state.medical_report", st.session_state.medical_report)
+    st.session_state.chat_summary = chat_summary
+    st.session_state.medical_report = fused["medical_report"]
+    st.session_state.report_generated = True
 
-        # Final rerun to show everything
-        st.rerun()
+    st.session_state.processing_stage = 'doctor_validation_stage'
+    print("st.session_state.medical_report", st.session_state.medical_report)
+    rerun()
 
 # Medical Report Section
 if st.session_state.medical_report:
@@ -330,7 +440,7 @@ if st.session_state.medical_report:
             with st.spinner("Checking doctor modifications...", show_time=True):
 
                 if st.session_state.edited_report != st.session_state.medical_report.strip():
-                    st.session_state.summarize_validated_report.summarize_doctor_validated_report(st.session_state.edited_report)
+                    get_summarize_validated_report().summarize_doctor_validated_report(st.session_state.edited_report)
                     st.success("✅ Doctor-modified report saved")
                 else:
                     st.info("🟡 No modifications detected — skipping storage.")
@@ -338,7 +448,7 @@ if st.session_state.medical_report:
                 st.session_state.processing_stage = None
                 st.session_state.doctor_validated = True
                 st.session_state.doctor_action_taken = True
-                st.rerun()
+                rerun()
 
     with col2:
         if st.button("🚫 No Modification", use_container_width=True, disabled=button_disabled):
@@ -346,7 +456,7 @@ if st.session_state.medical_report:
             st.session_state.processing_stage = None
             st.session_state.doctor_validated = True
             st.session_state.doctor_action_taken = True
-            st.rerun()
+            rerun()
 
     # 🔒 After doctor action, show message and keep section visible but locked
     if st.session_state.doctor_action_taken:
@@ -363,4 +473,6 @@ st.markdown(
     </div>
     """, 
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
+
+end_script_run()
@@ -1,11 +1,18 @@
-import boto3
 from dotenv import load_dotenv
 from langchain_aws import ChatBedrock
+from langchain_core.messages import AIMessage, SystemMessage
 import os
+import time
+
+from client_registry import get_bedrock_runtime_client, get_shared, is_offline_mode
+from llm_cache import LLMResponseCache
+from model_routing import resolve_models
+from prompt_cache import CACHE_CHECKPOINT, PromptCacheUsage, cache_usage_of, cacheable_blocks
+from telemetry import current_span, span, traced
 
 class BedrockModel:
     """
-    A class to initialize and hold a ChatBedrock language model instance.
+    A class to initialize and hold the ChatBedrock language models of an agent, one per routed call type.
     """
     def __init__(self,
         custom_model_kwargs: dict = None, # Default kwargs allow the user to easily override temperature, etc.
@@ -16,27 +23,159 @@ class BedrockModel:
 
         # define standard Bedrock configuration
         region_name = os.getenv("AWS_REGION")
-        model_arn = "arn:aws:bedrock:us-east-1:463554030939:inference-profile/us.anthropic.claude-3-7-sonnet-20250219-v1:0"
-        model_provider = "anthropic"
+        if is_offline_mode():
+            region_name = region_name or "us-east-1"  # ChatBedrock insists on a region even with a fake client
+        self.region_name = region_name
+        self.model_provider = "anthropic"
         
         # base model arguments, which can be overwritten by the user's input
         base_model_kwargs = {"temperature": 0}
         if custom_model_kwargs:
             base_model_kwargs.update(custom_model_kwargs)
+        self.model_kwargs = base_model_kwargs
 
-        # initialize a Bedrock client
-        self.bedrock_client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=region_name
-        )
-        
-        # initialize the ChatBedrock instance
-        self.llm_chat = ChatBedrock(
+        # shared Bedrock client (one keep-alive pool per process)
+        self.bedrock_client = get_bedrock_runtime_client(region_name)
+
+        # each call type of the agent runs on the model tier model_routing.json assigns it,
+        # falling back to the next larger tier when that model fails
+        self.routes = {}  # call type -> (model id used in cache keys, chat runnable)
+        self.model_id, self.llm_chat = self.route()
+
+        # memoization of deterministic calls (summary, report, validation), shared process-wide
+        self.llm_cache = None
+        if os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true":
+            self.llm_cache = get_shared(("llm_cache",), LLMResponseCache)
+
+        # Bedrock prompt caching of the stable prompt prefixes (system prompts, chat history so far);
+        # cache-read / cache-write tokens are reported per call and totalled per agent
+        self.prompt_caching = os.getenv("PROMPT_CACHING_ENABLED", "true").lower() == "true"
+        self.prompt_cache_usage = get_shared(("prompt_cache_usage",), PromptCacheUsage)
+
+    def build_chat_model(self, model_id):
+        return ChatBedrock(
             client=self.bedrock_client,
-            model_id=model_arn,
-            provider=model_provider,
-            model_kwargs=base_model_kwargs
+            region_name=self.region_name,
+            model_id=model_id,
+            provider=self.model_provider,
+            model_kwargs=self.model_kwargs
+        )
+
+    def route(self, call_type: str = None):
+        """(model id, chat model with fallbacks) serving call_type of this agent, built once per instance."""
+        route = self.routes.get(call_type)
+        if route is None:
+            chain = resolve_models(type(self).__name__, call_type)
+            models = [self.build_chat_model(model_id) for _, model_id in chain]
+            llm = models[0].with_fallbacks(models[1:]) if len(models) > 1 else models[0]
+
+            # model id as used in cache keys; offline replies get their own namespace
+            model_id = chain[0][1]
+            route = (f"offline/{model_id}" if is_offline_mode() else model_id, llm)
+            self.routes[call_type] = route
+            print(f"=== Model route {type(self).__name__}.{call_type or '*'}: {' -> '.join(tier for tier, _ in chain)} ===")
+        return route
+
+    def system_message(self, text):
+        """SystemMessage for a fixed prompt, marked as a prompt-cache checkpoint when caching is on."""
+        if not self.prompt_caching:
+            return SystemMessage(content=text)
+        return SystemMessage(content=cacheable_blocks(text))
+
+    def cacheable_content(self, static_text, dynamic_text):
+        """Message content with a fixed instruction prefix cached ahead of the per-call text."""
+        if not self.prompt_caching:
+            return static_text + "\n" + dynamic_text
+        return cacheable_blocks(static_text, dynamic_text)
+
+    def cache_checkpoint_kwargs(self):
+        """Call kwargs placing a checkpoint on the latest message (multi-turn prefix caching)."""
+        return {"cache_control": dict(CACHE_CHECKPOINT)} if self.prompt_caching else {}
+
+    def record_usage(self, message):
+        """Report the cache-read / cache-write split of a response (or final stream chunk)."""
+        usage = cache_usage_of(message)
+        if usage is None:
+            return None
+        agent = type(self).__name__
+        self.prompt_cache_usage.record(agent, usage)
+        print(
+            f"=== Prompt cache ({agent}): read {usage['cache_read_tokens']} | write {usage['cache_write_tokens']} "
+            f"| uncached {usage['input_tokens']} input tokens ==="
         )
+        return usage
+
+    def prompt_cache_stats(self):
+        return self.prompt_cache_usage.stats()
+
+    def llm_attributes(self, call_type: str = None):
+        return {"agent": type(self).__name__, "call_type": call_type or "default"}
+
+    def llm_span(self, call_type: str = None, **attributes):
+        """Telemetry span of one model call of this agent."""
+        return span("llm", **self.llm_attributes(call_type), **attributes)
+
+    def invoke_llm(self, messages, use_cache: bool = True, call_type: str = None, **call_kwargs):
+        """Routed llm.invoke(messages, **call_kwargs), answered from the response cache when possible."""
+        model_id, llm = self.route(call_type)
+        with self.llm_span(call_type) as stage:
+            if self.llm_cache is None or not use_cache:
+                response = llm.invoke(messages, **call_kwargs)
+                self.record_usage(response)
+                return response
+
+            agent = type(self).__name__
+            key = self.llm_cache.make_key(model_id, dict(self.model_kwargs, **call_kwargs), messages)
+
+            cached = self.llm_cache.get(key, agent=agent)
+            stage.set(cached=cached is not None)
+            if cached is not None:
+                return AIMessage(content=cached)
+
+            response = llm.invoke(messages, **call_kwargs)
+            self.record_usage(response)
+            self.llm_cache.put(key, response.content)
+            return response
+
+    @traced("llm", streaming=True)
+    def stream_llm(self, messages, use_cache: bool = True, call_type: str = None, **call_kwargs):
+        """Yield response text chunks, replaying a cached response in one chunk when available."""
+        stage = current_span()
+        stage.set(**self.llm_attributes(call_type))
+
+        model_id, llm = self.route(call_type)
+        key = None
+        if self.llm_cache is not None and use_cache:
+            agent = type(self).__name__
+            key = self.llm_cache.make_key(model_id, dict(self.model_kwargs, **call_kwargs), messages)
+
+            cached = self.llm_cache.get(key, agent=agent)
+            stage.set(cached=cached is not None)
+            if cached is not None:
+                yield cached
+                return
+
+        start = time.perf_counter()
+        chunks = []
+        for chunk in llm.stream(messages, **call_kwargs):
+            text = self.get_chunk_text(chunk)
+            if text:
+                if not chunks:
+                    stage.set(first_token_ms=(time.perf_counter() - start) * 1000)
+                chunks.append(text)
+                yield text
+            self.record_usage(chunk)
+
+        # only a fully consumed stream is cached
+        if key is not None:
+            self.llm_cache.put(key, "".join(chunks))
+
+    @staticmethod
+    def get_chunk_text(chunk):
+        """Text of a streamed message chunk (plain string or list of content blocks)."""
+        if isinstance(chunk.content, str):
+            return chunk.content
+        return "".join(block.get("text", "") for block in chunk.content if isinstance(block, dict))
 
 if __name__=="__main__":
     pass
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Post-conversation latency: the two-call flow (summary, retrieval on the summary, report) against
+the single-pass mode (retrieval on the conversation, summary + report in one call).
+
+Every transcript is played through the conversation agent once, then the finished conversation is
+reported in both modes, --repeat times each, alternating which mode goes first. The session is only
+ended afterwards, so every report sees what production does: the latest intermediate summary
+checkpoint and, with PREFETCH_EVERY_N_TURNS, the prefetched retrieval candidates. The LLM response
+cache is disabled so every report is a real model call. Runs against AWS, or locally with
+OFFLINE_MODE=true, where OFFLINE_CHAT_LATENCY_P50_MS / _P99_MS and OFFLINE_PREFILL_MS_PER_1K_TOKENS
+model the Bedrock latency.
+
+    OFFLINE_MODE=true OFFLINE_CHAT_LATENCY_P50_MS=800 python benchmark_report_modes.py
+    python benchmark_report_modes.py --transcripts ../data/sample_transcripts.jsonl --repeat 3 --json
+"""
+
+import os
+import json
+import time
+import argparse
+
+# every report must reach the model, otherwise the second mode is answered from the cache
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+from test_medical_pipeline import MedicalPipeline, load_transcripts
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TRANSCRIPTS = os.path.join(os.path.dirname(SCRIPTS_DIR), "data", "sample_transcripts.jsonl")
+
+MODES = ["two_call", "fused"]
+
+
+def play_conversation(pipeline, session_id, turns):
+    """Full chat of a scripted conversation (STOP appended unless the assistant ended it)."""
+    full_chat, stop_chat = None, False
+    for user_input in turns:
+        _, stop_chat, full_chat = pipeline.conversation_agent.chat(session_id, user_input)
+        if stop_chat:
+            break
+    if not stop_chat:
+        _, _, full_chat = pipeline.conversation_agent.chat(session_id, "stop")
+    return full_chat
+
+
+def benchmark(pipeline, transcripts, repeat: int = 3):
+    """{mode: per-stage p50 / p95 / max} of the post-conversation work, "total" being its wall time."""
+    runs = {mode: [] for mode in MODES}
+
+    for index, transcript in enumerate(transcripts):
+        session_id = transcript.get("session_id") or f"report-benchmark-{index}"
+        full_chat = play_conversation(pipeline, session_id, transcript["turns"])
+        # generate_report pops the prefetch, so hand the same one to every report
+        prefetched = pipeline.conversation_agent.prefetched.get(session_id)
+
+        for r in range(repeat):
+            for mode in (MODES if r % 2 == 0 else MODES[::-1]):
+                if prefetched is not None:
+                    pipeline.conversation_agent.prefetched[session_id] = prefetched
+                start = time.perf_counter()
+                _, result = pipeline.generate_report(session_id, full_chat, mode=mode)
+                timings = dict(result["timings"], total=time.perf_counter() - start)
+                runs[mode].append({"session_id": session_id, "timings": timings})
+        pipeline.session_results.pop(session_id, None)
+        pipeline.conversation_agent.end_session(session_id)
+
+    return {mode: MedicalPipeline.summarize_timings(results, 0.0)["stages"] for mode, results in runs.items()}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Two-call vs single-pass report latency")
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS, help="JSONL transcripts ({\"turns\": [...]})")
+    parser.add_argument("--repeat", type=int, default=3, help="reports per mode and transcript")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    pipeline = MedicalPipeline()
+    results = benchmark(pipeline, load_transcripts(args.transcripts), repeat=args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("\n" + "=" * 60)
+        print("POST-CONVERSATION LATENCY (seconds)")
+        print("=" * 60)
+        for mode, stages in results.items():
+            print(f"--- {mode} ---")
+            for stage, stats in stages.items():
+                print(f"{stage:22s} p50 {stats['p50']:7.3f}s  p95 {stats['p95']:7.3f}s  max {stats['max']:7.3f}s")
+
+        two_call, fused = results["two_call"]["total"]["p50"], results["fused"]["total"]["p50"]
+        print(f"=== Single pass p50 {fused:.3f}s vs two calls {two_call:.3f}s "
+              f"({two_call / fused if fused else 0:.2f}x) ===")
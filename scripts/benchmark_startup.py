@@ -0,0 +1,176 @@
+"""
+Cold-start benchmark for the scripts package.
+
+Every module is imported in a fresh interpreter (as on a new ECS task), timing the import and
+recording which heavyweight dependencies it pulls in. With --first-request the agent is also
+constructed and its first call timed (needs AWS access, or OFFLINE_MODE=true for the local fakes).
+Results are checked against import_budget.json; the exit code is 1 when a budget is exceeded.
+
+    python benchmark_startup.py
+    python benchmark_startup.py --first-request --repeat 5
+    python benchmark_startup.py --importtime medical_data_store
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET_PATH = os.path.join(SCRIPTS_DIR, "import_budget.json")
+
+HEAVY_MODULES = [
+    "streamlit", "langchain_aws", "langchain_community", "boto3",
+    "opensearchpy", "pandas", "tqdm", "numpy",
+]
+
+SAMPLE_CHAT = [
+    {"HumanMessage": "I have a throbbing headache"},
+    {"AIMessage": "How long have you had it?"},
+    {"HumanMessage": "two days, with nausea"},
+    {"AIMessage": "STOP"},
+]
+
+# module -> (constructor, first call on `agent`)
+FIRST_REQUESTS = {
+    "conversation_agent": ("ConversationAgent()", "agent.chat('benchmark', 'I have a throbbing headache')"),
+    "chat_summary_agent": ("ChatSummaryAgent()", "agent.generate_chat_summary(SAMPLE_CHAT)"),
+    "retrieval_agent": ("MedicalDataRetrieval()", "agent.retrieve_data('throbbing headache and nausea')"),
+    "report_generator_agent": (
+        "ReportGeneratorAgent()",
+        "agent.generate_final_medical_report(SAMPLE_CHAT, 'Throbbing headache with nausea for two days.')"
+    ),
+}
+
+PROBE = """
+import sys, json, time, importlib
+module, constructor, call = sys.argv[1], sys.argv[2], sys.argv[3]
+heavy = json.loads(sys.argv[4])
+result = {}
+
+start = time.perf_counter()
+mod = importlib.import_module(module)
+result["import_ms"] = (time.perf_counter() - start) * 1000
+result["heavy_loaded"] = [name for name in heavy if name in sys.modules]
+
+if constructor:
+    namespace = dict(vars(mod), SAMPLE_CHAT=json.loads(sys.argv[5]))
+    start = time.perf_counter()
+    agent = eval(constructor, namespace)
+    result["construct_ms"] = (time.perf_counter() - start) * 1000
+    namespace["agent"] = agent
+    start = time.perf_counter()
+    eval(call, namespace)
+    result["first_request_ms"] = (time.perf_counter() - start) * 1000
+
+print("BENCHMARK_RESULT " + json.dumps(result))
+"""
+
+
+def load_budget(path: str = BUDGET_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def probe(module: str, first_request: bool = False):
+    """Import (and optionally exercise) a module in a fresh interpreter."""
+    constructor, call = FIRST_REQUESTS.get(module, ("", "")) if first_request else ("", "")
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, module, constructor, call, json.dumps(HEAVY_MODULES), json.dumps(SAMPLE_CHAT)],
+        cwd=SCRIPTS_DIR,
+        env=dict(os.environ, PYTHONPATH=SCRIPTS_DIR),
+        capture_output=True,
+        text=True,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("BENCHMARK_RESULT "):
+            return json.loads(line[len("BENCHMARK_RESULT "):])
+    raise RuntimeError(f"{module} failed:\n{completed.stderr[-2000:]}")
+
+
+def benchmark(modules, repeat: int = 3, first_request: bool = False):
+    """Median timings per module over `repeat` cold runs."""
+    results = {}
+    for module in modules:
+        runs = [probe(module, first_request) for _ in range(repeat)]
+        summary = {"heavy_loaded": runs[-1]["heavy_loaded"]}
+        for metric in ("import_ms", "construct_ms", "first_request_ms"):
+            if metric in runs[-1]:
+                summary[metric] = statistics.median(run[metric] for run in runs)
+        results[module] = summary
+    return results
+
+
+def check_budget(results, budget):
+    """List of budget violations (slow imports, forbidden dependencies loaded at import)."""
+    violations = []
+    for module, limits in budget.items():
+        if module not in results:
+            continue
+        result = results[module]
+        if "max_import_ms" in limits and result["import_ms"] > limits["max_import_ms"]:
+            violations.append(f"{module}: import took {result['import_ms']:.0f} ms (budget {limits['max_import_ms']} ms)")
+        for name in limits.get("forbidden", []):
+            if name in result["heavy_loaded"]:
+                violations.append(f"{module}: imports {name} at module load")
+    return violations
+
+
+def print_importtime(module: str, top: int = 15):
+    """Largest cumulative import times reported by `python -X importtime`."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPTS_DIR,
+        env=dict(os.environ, PYTHONPATH=SCRIPTS_DIR),
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  <self us> | <cumulative us> | <indented module name>"
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), int(self_us), name))
+
+    print(f"=== -X importtime: {module} ===")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:9.1f} ms cumulative {self_us / 1000:8.1f} ms self  {name.strip()}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Cold-start import / first-request benchmark")
+    parser.add_argument("modules", nargs="*", help="modules to benchmark (default: every module in the budget)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--first-request", action="store_true", help="also construct each agent and time its first call")
+    parser.add_argument("--importtime", metavar="MODULE", help="print the slowest imports of MODULE and exit")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    if args.importtime:
+        print_importtime(args.importtime)
+        sys.exit(0)
+
+    budget = load_budget()
+    results = benchmark(args.modules or list(budget), repeat=args.repeat, first_request=args.first_request)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("=== Cold start (median of %d fresh interpreters) ===" % args.repeat)
+        for module, result in results.items():
+            line = f"{module:28s} import {result['import_ms']:8.1f} ms"
+            if "first_request_ms" in result:
+                line += f" | construct {result['construct_ms']:8.1f} ms | first request {result['first_request_ms']:8.1f} ms"
+            print(line + f" | loads: {', '.join(result['heavy_loaded']) or '-'}")
+
+    violations = check_budget(results, budget)
+    if violations:
+        print("=== Import budget exceeded ===")
+        for violation in violations:
+            print(f"- {violation}")
+        sys.exit(1)
+    print("=== Import budget OK ===")
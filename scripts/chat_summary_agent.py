@@ -1,7 +1,8 @@
-import yaml
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage
 
 from bedrock_initializer import BedrockModel
+from prompt_loader import load_prompts
+from telemetry import traced
 
 class ChatSummaryAgent(BedrockModel):
 
@@ -10,20 +11,15 @@ class ChatSummaryAgent(BedrockModel):
         # accessing bedrock model from it self.llm_chat
         super().__init__(**kwargs) 
 
-        # Load prompts
-        # prompts_path = "prompts.yaml"
-        prompts_path = "/app/scripts/prompts.yaml"
-        with open(prompts_path, 'r') as f:
-            prompts = yaml.safe_load(f)
+        # Load prompts (parsed once per process)
+        prompts = load_prompts()
 
         # # Access prompts
         self.rag_summary_prompt = prompts['medical_assistant']['rag_summary_prompt']
-        
-    def generate_chat_summary(self, full_chat):
-
-        print("____________________________________\n")
-        print("=== GENERATING FINAL CHAT SUMMARY ===")
+        self.rag_summary_incremental_prompt = prompts['medical_assistant']['rag_summary_incremental_prompt']
 
+    @staticmethod
+    def get_conversation_lines(full_chat):
         conversation_lines = []
         
         for messages_dict in full_chat:
@@ -32,13 +28,38 @@ class ChatSummaryAgent(BedrockModel):
             elif "AIMessage" in messages_dict:
                 conversation_lines.append(f"Assistant: {messages_dict['AIMessage']}")
 
-        conversation_lines = "\n".join(conversation_lines)
+        return "\n".join(conversation_lines)
+
+    @traced("final_summary")
+    def generate_chat_summary(self, full_chat, checkpoint=None):
+
+        """
+        Final summary of the conversation.
+
+        checkpoint is the latest intermediate summary ({"summary", "covered_messages"}, see
+        ConversationAgent.get_summary_checkpoint): only the turns after it are sent along with it,
+        so the cost no longer grows with the length of the conversation.
+        """
+        print("____________________________________\n")
+        print("=== GENERATING FINAL CHAT SUMMARY ===")
+
+        covered = checkpoint["covered_messages"] if checkpoint else 0
+        if 0 < covered <= len(full_chat):
+            print(f"=== Incremental summary: {covered} messages from checkpoint, {len(full_chat) - covered} new ===")
+            system_prompt = self.rag_summary_prompt.strip() + "\n\n" + self.rag_summary_incremental_prompt.strip()
+            conversation_lines = (
+                f"EARLIER CONVERSATION SUMMARY:\n{checkpoint['summary']}\n\n"
+                f"LATER CONVERSATION:\n{self.get_conversation_lines(full_chat[covered:])}"
+            )
+        else:
+            system_prompt = self.rag_summary_prompt
+            conversation_lines = self.get_conversation_lines(full_chat)
 
         # Final summary (can be shown to user)
-        summary = self.llm_chat.invoke([
-            SystemMessage(content=self.rag_summary_prompt),
+        summary = self.invoke_llm([
+            self.system_message(system_prompt),
             HumanMessage(content=conversation_lines)
-        ])
+        ], call_type="final_summary")
 
         print("=== FINAL CHAT SUMMARY GENERATED ===")
         
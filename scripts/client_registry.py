@@ -0,0 +1,106 @@
+"""
+Process-wide registry of AWS / OpenSearch clients.
+
+boto3 clients and the OpenSearch client are thread-safe, so every agent and every Streamlit
+session reuses the same instances (and their keep-alive connection pools) instead of paying
+new TLS handshakes and index-existence checks.
+
+With OFFLINE_MODE=true the local fakes from offline_clients are returned instead, so the
+pipeline runs without AWS credentials or network access.
+"""
+
+import os
+import threading
+import boto3
+from botocore.config import Config
+from dotenv import load_dotenv
+from opensearchpy import OpenSearch
+
+_clients = {}
+_lock = threading.RLock()  # re-entrant: factories may fetch other shared clients
+
+
+def _get_or_create(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def is_offline_mode():
+    return os.getenv("OFFLINE_MODE", "false").lower() == "true"
+
+
+def _offline_client(name):
+    import offline_clients
+    return _get_or_create(("offline", name), getattr(offline_clients, name))
+
+
+def _boto_config():
+    return Config(
+        max_pool_connections=int(os.getenv("AWS_MAX_POOL_CONNECTIONS", 50)),
+        tcp_keepalive=True,
+        retries={"max_attempts": int(os.getenv("AWS_MAX_ATTEMPTS", 3)), "mode": "adaptive"},
+    )
+
+
+def get_bedrock_runtime_client(region_name: str = None):
+    """Shared bedrock-runtime client (chat models and Titan embeddings)."""
+    load_dotenv(dotenv_path="/app/.env")
+    region_name = region_name or os.getenv("AWS_REGION")
+    if is_offline_mode():
+        return _offline_client("FakeBedrockRuntime")
+
+    return _get_or_create(
+        ("bedrock-runtime", region_name),
+        lambda: boto3.client(service_name="bedrock-runtime", region_name=region_name, config=_boto_config())
+    )
+
+
+def get_s3_client(region_name: str = None):
+    """Shared S3 client."""
+    load_dotenv(dotenv_path="/app/.env")
+    region_name = region_name or os.getenv("AWS_REGION")
+    if is_offline_mode():
+        return _offline_client("FakeS3Client")
+
+    return _get_or_create(
+        ("s3", region_name),
+        lambda: boto3.client(service_name="s3", region_name=region_name, config=_boto_config())
+    )
+
+
+def get_opensearch_client():
+    """Shared OpenSearch client with a keep-alive pool and gzip request compression."""
+    load_dotenv(dotenv_path="/app/.env")
+    host = os.getenv("AWS_OPENSEARCH_HOST")
+    if is_offline_mode():
+        return _offline_client("FakeOpenSearch")
+
+    return _get_or_create(
+        ("opensearch", host),
+        lambda: OpenSearch(
+            hosts=[{"host": host, "port": 443}],
+            http_auth=(os.getenv("AWS_OPENSEARCH_USERNAME"), os.getenv("AWS_OPENSEARCH_PASSWORD")),
+            use_ssl=True,
+            verify_certs=True,
+            http_compress=True,
+            pool_maxsize=int(os.getenv("OPENSEARCH_POOL_MAXSIZE", 25)),
+            timeout=int(os.getenv("OPENSEARCH_TIMEOUT", 30)),
+        )
+    )
+
+
+def get_shared(key, factory):
+    """Shared instance of any other process-wide resource (vector store, embedding cache...)."""
+    return _get_or_create(key, factory)
+
+
+def reset_clients():
+    """Drop every cached client, e.g. after credentials rotate."""
+    with _lock:
+        _clients.clear()
@@ -1,76 +1,227 @@
-import yaml
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import HumanMessage, AIMessage
 
 from bedrock_initializer import BedrockModel
+from prompt_loader import load_prompts
+from session_store import SessionStore
+from telemetry import current_span, span, traced
+from token_budget import elide_to_tokens, estimate_message_tokens, estimate_tokens, truncate_to_tokens
+
+SUMMARY_PREFIX = "Previous conversation summary: "
 
 class ConversationAgent(BedrockModel):
 
-    def __init__(self, **kwargs):
+    def __init__(self, retrieval_agent=None, prefetch_every_n_turns: int = None, **kwargs):
 
         # accessing bedrock model from it self.llm_chat
         super().__init__(**kwargs) 
 
-        self.intermediate_summary_threshold = 10
-        self.final_summary_threshold = 20
-
-        self.store = {}
-        self.full_chat_session = {}
-
-        # Load prompts
-        # prompts_path = "prompts.yaml"
-        prompts_path = "/app/scripts/prompts.yaml"
-        with open(prompts_path, 'r') as f:
-            prompts = yaml.safe_load(f)
+        # context compaction is driven by the estimated prompt size, not a message count:
+        # history is summarized once it grows past the trigger, and no chat call may exceed the max
+        self.max_prompt_tokens = int(os.getenv("CHAT_MAX_PROMPT_TOKENS", 4000))
+        self.compaction_trigger_tokens = int(os.getenv("CHAT_COMPACTION_TRIGGER_TOKENS", 2000))
+
+        # summaries run on a worker after the reply is returned and are swapped in on a later turn
+        self.background_compaction = os.getenv("CHAT_BACKGROUND_COMPACTION", "true").lower() == "true"
+        self.pending_compactions = SessionStore(namespace="compaction", disk_path="")  # session_id -> (snapshot length, last message, full chat messages covered, Future)
+        self.compaction_executor = None
+        if self.background_compaction:
+            self.compaction_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-compaction")
+
+        # bounded per-session state (idle TTL + LRU, optional SQLite spill via SESSION_STORE_PATH)
+        self.store = SessionStore(namespace="history")
+        self.full_chat_session = SessionStore(namespace="full_chat")
+        self.summary_checkpoints = SessionStore(namespace="summary_checkpoint")  # session_id -> latest intermediate summary
+        self.stream_results = {}  # (response, stop_chat, full_chat) of the last streamed turn
+
+        # rolling retrieval prefetch: every N turns embed the patient text so far and keep
+        # a warm top-k candidate set per session (0 disables, needs a MedicalDataRetrieval)
+        self.retrieval_agent = retrieval_agent
+        if prefetch_every_n_turns is None:
+            prefetch_every_n_turns = int(os.getenv("PREFETCH_EVERY_N_TURNS", 0))
+        self.prefetch_every_n_turns = prefetch_every_n_turns if retrieval_agent is not None else 0
+        self.prefetch_candidate_k = int(os.getenv("SPECULATIVE_CANDIDATE_K", 10))
+        self.prefetched = SessionStore(namespace="prefetch", disk_path="")  # session_id -> Future of (query embedding, hits)
+        self.prefetch_executor = None
+        if self.prefetch_every_n_turns:
+            self.prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval-prefetch")
+
+        # Load prompts (parsed once per process)
+        prompts = load_prompts()
 
         # Access prompts
         self.system_chat_prompt = prompts['medical_assistant']['system_chat_prompt']
         self.intermediate_summary_prompt = prompts['medical_assistant']['intermediate_summary_prompt']
         
-        self.chat_with_history = RunnableWithMessageHistory(self.llm_chat, self.get_history)
+        # the system prompt and, through a checkpoint on the newest message, the history up to it are
+        # cached, so each turn only prefills what was added since the previous one
+        self.chat_with_history = RunnableWithMessageHistory(
+            self.route("chat")[1].bind(**self.cache_checkpoint_kwargs()), self.get_history
+        )
 
-    def get_conversation_text(self, history):
+    def get_conversation_text(self, messages):
         """Convert conversation to readable text"""
         conversation_lines = []
         
-        for message in history.messages:
+        for message in messages:
             if isinstance(message, HumanMessage):
                 conversation_lines.append(f"Patient: {message.content}")
             elif isinstance(message, AIMessage):
                 conversation_lines.append(f"Assistant: {message.content}")
-        
-        # remove last ai message for intermediate summary
-        conversation_lines = conversation_lines[:-1]
 
         return "\n".join(conversation_lines)
 
+    @traced("intermediate_summary")
+    def summarize_messages(self, messages):
+        """Intermediate summary text of the given turns."""
+        with self.llm_span("intermediate_summary"):
+            summary = self.route("intermediate_summary")[1].invoke([
+                self.system_message(self.intermediate_summary_prompt),
+                HumanMessage(content=self.get_conversation_text(messages))
+            ])
+        self.record_usage(summary)
+        print("=== BACKEND: Intermediate summary completed ===")
+        print(summary)
+        return summary.content
+
+    def compacted_history(self, summary, last_msg, tail=()):
+        """Fresh history: system prompt, summary, the message kept verbatim and any later turns."""
+        # the summary is its own message (Bedrock merges consecutive human messages into one
+        # turn), so budget trimming can cut it without touching the patient's newest text
+        history = ChatMessageHistory()
+        history.add_message(self.system_message(self.system_chat_prompt))
+        history.add_message(HumanMessage(content=f"{SUMMARY_PREFIX}{summary}"))
+        if isinstance(last_msg, HumanMessage):
+            history.add_message(HumanMessage(content=last_msg.content))
+        else:
+            history.add_message(AIMessage(content=last_msg.content))
+        for message in tail:
+            history.add_message(message)
+        return history
+
+    def summarized_messages_count(self, session_id, last_msg):
+        """Number of full chat messages covered by a summary of the history before last_msg."""
+        full_chat = self.full_chat_session.get(session_id)
+        count = len(full_chat.messages) if full_chat is not None else 0
+
+        # after a turn the kept AI reply is already in the full chat, the pending patient message before a call is not
+        return count - 1 if isinstance(last_msg, AIMessage) else count
+
+    def save_summary_checkpoint(self, session_id, summary, covered_messages):
+        """Remember the latest intermediate summary, so the final summary only needs the turns after it."""
+        if covered_messages > 0:
+            self.summary_checkpoints[session_id] = {"summary": summary, "covered_messages": covered_messages}
+
+    def get_summary_checkpoint(self, session_id):
+        """{"summary", "covered_messages"} of the latest intermediate summary of the session, or None."""
+        return self.summary_checkpoints.get(session_id)
+
     def generate_intermediate_summary(self, session_id):
         """Generate summary - backend only, not shown to user"""
         history = self.store[session_id]
 
-        # Intermediate summary (backend only)
-        last_ai_msg = history.messages[-1].content
-        conversation_lines = self.get_conversation_text(history)
-        summary = self.llm_chat.invoke([
-            SystemMessage(content=self.intermediate_summary_prompt),
-            HumanMessage(content=conversation_lines)
-        ])
-        
-        # Reset history with summary as context
-        self.store[session_id] = ChatMessageHistory()
-        self.store[session_id].add_message(SystemMessage(content=self.system_chat_prompt))
-        self.store[session_id].add_message(HumanMessage(content=f"Previous conversation summary: {summary.content}"))
-        self.store[session_id].add_message(AIMessage(content=last_ai_msg))
+        # summarize everything but the newest message, which is kept verbatim: the last AI
+        # reply after a turn, or the pending patient message before a call over budget
+        last_msg = history.messages[-1]
+        summary = self.summarize_messages(history.messages[:-1])
+        self.save_summary_checkpoint(session_id, summary, self.summarized_messages_count(session_id, last_msg))
 
-        print("=== BACKEND: Intermediate summary completed ===")
-        print(summary)
+        # Reset history with summary as context
+        self.store[session_id] = self.compacted_history(summary, last_msg)
         return None  # Don't return summary to frontend
 
+    def schedule_compaction(self, session_id):
+        """Summarize a snapshot of the history on a worker; the result is swapped in by apply_pending_compaction."""
+        if session_id in self.pending_compactions:
+            return
+
+        snapshot = list(self.store[session_id].messages)
+        print("=== BACKEND: Scheduling intermediate summary ===")
+        self.pending_compactions[session_id] = (
+            len(snapshot),
+            snapshot[-1],
+            self.summarized_messages_count(session_id, snapshot[-1]),
+            self.compaction_executor.submit(self.summarize_messages, snapshot[:-1]),
+        )
+
+    def apply_pending_compaction(self, session_id, wait: bool = False):
+        """
+        Swap a finished background summary into the session history.
+
+        Turns added after the snapshot are carried over, so a patient who replied before the
+        summary was ready loses nothing. Without wait, an unfinished summary is left running and
+        the current (longer, still valid) history is used for this turn.
+        """
+        pending = self.pending_compactions.get(session_id)
+        if pending is None:
+            return
+        snapshot_len, last_msg, covered_messages, future = pending
+        if not wait and not future.done():
+            return
+        self.pending_compactions.pop(session_id, None)
+
+        try:
+            summary = future.result()
+        except Exception as e:
+            print(f"=== BACKEND: Intermediate summary failed, keeping full history: {e} ===")
+            return
+
+        history = self.store[session_id]
+        if len(history.messages) < snapshot_len or history.messages[snapshot_len - 1] is not last_msg:
+            return  # history was reset since the snapshot
+
+        # single assignment in the request thread, so a turn never sees a half-built history
+        self.store[session_id] = self.compacted_history(summary, last_msg, history.messages[snapshot_len:])
+        self.save_summary_checkpoint(session_id, summary, covered_messages)
+        print("=== BACKEND: Intermediate summary applied ===")
+
+    def enforce_prompt_budget(self, session_id):
+        """Keep the next chat call under max_prompt_tokens, compacting (and if needed truncating) history."""
+        history = self.store[session_id]
+        if estimate_message_tokens(history.messages) <= self.max_prompt_tokens:
+            return
+
+        # a background summary of the older turns may already be on its way
+        if session_id in self.pending_compactions:
+            self.apply_pending_compaction(session_id, wait=True)
+            history = self.store[session_id]
+
+        if estimate_message_tokens(history.messages) > self.max_prompt_tokens and len(history.messages) > 2:
+            print("=== BACKEND: Prompt over budget, generating intermediate summary ===")
+            self.generate_intermediate_summary(session_id)
+            history = self.store[session_id]
+
+        # still over: cut the summary first, the newest patient text is what the reply must answer
+        overflow = estimate_message_tokens(history.messages) - self.max_prompt_tokens
+        summary_index = next((
+            i for i, message in enumerate(history.messages[1:-1], start=1)
+            if isinstance(message, HumanMessage) and message.content.startswith(SUMMARY_PREFIX)
+        ), None)
+        if overflow > 0 and summary_index is not None:
+            summary_msg = history.messages[summary_index]
+            keep_tokens = estimate_tokens(summary_msg.content) - overflow
+            if keep_tokens < 32:
+                del history.messages[summary_index]  # too little left to be a useful summary
+            else:
+                history.messages[summary_index] = HumanMessage(content=truncate_to_tokens(summary_msg.content, keep_tokens))
+            overflow = estimate_message_tokens(history.messages) - self.max_prompt_tokens
+
+        # a single oversized patient message: drop its middle, keeping the most recent part
+        # (at least a few sentences of it, even if the system prompt leaves no room)
+        if overflow > 0:
+            last_msg = history.messages[-1]
+            history.messages[-1] = HumanMessage(
+                content=elide_to_tokens(last_msg.content, max(estimate_tokens(last_msg.content) - overflow, 64))
+            )
+
     def get_history(self, session_id):
         if session_id not in self.store:
             self.store[session_id] = ChatMessageHistory()
-            self.store[session_id].add_message(SystemMessage(content=self.system_chat_prompt))
+            self.store[session_id].add_message(self.system_message(self.system_chat_prompt))
         return self.store[session_id]
     
     def get_full_chat(self, user_query, ai_resp, session_id, stop_chat):
@@ -95,21 +246,44 @@ class ConversationAgent(BedrockModel):
 
         return full_chat
 
-    def chat(self, session_id, user_query):
-
-        history = self.get_history(session_id)
-        
-        # Add human message to history
-        history.add_message(HumanMessage(content=user_query))
-
-        if user_query.lower().strip() in ["stop", "end", "finish"]:
-            resp = AIMessage(content="STOP")
-        else:
-            resp = self.chat_with_history.invoke(
-                {"messages":[]},
-                config={"configurable": {"session_id": session_id}}
-            )
-
+    def is_stop_query(self, user_query):
+        return user_query.lower().strip() in ["stop", "end", "finish"]
+
+    def get_patient_text(self, session_id):
+        """All patient turns of the session so far."""
+        return "\n".join(
+            message.content for message in self.full_chat_session[session_id].messages
+            if isinstance(message, HumanMessage)
+        )
+
+    def prefetch_retrieval(self, session_id):
+        """Start a background k-NN lookup on the accumulated patient text."""
+        patient_text = self.get_patient_text(session_id)
+        if not patient_text.strip():
+            return
+
+        print("=== BACKEND: Prefetching retrieval candidates ===")
+        self.prefetched[session_id] = self.prefetch_executor.submit(
+            self.retrieval_agent.retrieve_candidates, patient_text, self.prefetch_candidate_k
+        )
+
+    def pop_prefetched_candidates(self, session_id, timeout: float = None):
+        """
+        Return the session's warm (query embedding, hits) candidate set, or None.
+
+        Waits up to timeout seconds for a prefetch that is still in flight.
+        """
+        future = self.prefetched.pop(session_id, None)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            print(f"=== BACKEND: Retrieval prefetch unavailable: {e} ===")
+            return None
+
+    def finish_turn(self, session_id, user_query, resp, history):
+        """Record the turn in the full chat, detect STOP and compact history if needed."""
         stop_chat = False
 
         full_chat = self.get_full_chat(user_query, resp, session_id, stop_chat)
@@ -120,14 +294,112 @@ class ConversationAgent(BedrockModel):
             full_chat = self.get_full_chat(user_query, resp, session_id, stop_chat)
             return resp.content, stop_chat, full_chat
 
-        # Generate intermediate summary if threshold reached (backend only)
-        if len(history.messages) == self.intermediate_summary_threshold + 1:
-            print("=== BACKEND: Generating intermediate summary ===")
-            self.generate_intermediate_summary(session_id)
+        # Refresh the warm retrieval candidates every N patient turns
+        if self.prefetch_every_n_turns:
+            n_turns = len(self.full_chat_session[session_id].messages) // 2
+            if n_turns % self.prefetch_every_n_turns == 0:
+                self.prefetch_retrieval(session_id)
+
+        # Generate intermediate summary once the history outgrows the compaction trigger (backend only);
+        # re-read the history, a budget compaction may have replaced it during this turn
+        history = self.store[session_id]
+        if estimate_message_tokens(history.messages) > self.compaction_trigger_tokens:
+            if self.background_compaction:
+                self.schedule_compaction(session_id)
+            else:
+                print("=== BACKEND: Generating intermediate summary ===")
+                self.generate_intermediate_summary(session_id)
             # Continue with normal conversation
         
         # Return only the AI response for frontend display
         return resp.content, stop_chat, full_chat
+
+    def chat(self, session_id, user_query):
+
+        with span("chat_turn", session_id=session_id):
+            self.apply_pending_compaction(session_id)
+            history = self.get_history(session_id)
+
+            # Add human message to history
+            history.add_message(HumanMessage(content=user_query))
+
+            if self.is_stop_query(user_query):
+                resp = AIMessage(content="STOP")
+            else:
+                self.enforce_prompt_budget(session_id)
+                with self.llm_span("chat"):
+                    resp = self.chat_with_history.invoke(
+                        {"messages":[]},
+                        config={"configurable": {"session_id": session_id}}
+                    )
+                self.record_usage(resp)
+
+            return self.finish_turn(session_id, user_query, resp, history)
+
+    @traced("chat_turn", streaming=True)
+    def chat_stream(self, session_id, user_query):
+        """
+        Streaming variant of chat(): yields response text as Bedrock produces it.
+
+        Once the generator is exhausted the (response, stop_chat, full_chat) tuple
+        is available from pop_stream_result(session_id).
+        """
+        current_span().set(session_id=session_id)
+        self.apply_pending_compaction(session_id)
+        history = self.get_history(session_id)
+
+        # Add human message to history
+        history.add_message(HumanMessage(content=user_query))
+
+        if self.is_stop_query(user_query):
+            resp = AIMessage(content="STOP")
+            yield resp.content
+        else:
+            self.enforce_prompt_budget(session_id)
+            chunks = []
+            for text in self.stream_chat(session_id):
+                chunks.append(text)
+                yield text
+            resp = AIMessage(content="".join(chunks))
+
+        self.stream_results[session_id] = self.finish_turn(session_id, user_query, resp, history)
+
+    @traced("llm", streaming=True)
+    def stream_chat(self, session_id):
+        """Text chunks of the chat model's reply to the session history."""
+        stage = current_span()
+        stage.set(**self.llm_attributes("chat"))
+
+        # RunnableWithMessageHistory appends the aggregated AI message once the stream ends
+        start = time.perf_counter()
+        first = True
+        for chunk in self.chat_with_history.stream(
+            {"messages":[]},
+            config={"configurable": {"session_id": session_id}}
+        ):
+            text = self.get_chunk_text(chunk)
+            if text:
+                if first:
+                    stage.set(first_token_ms=(time.perf_counter() - start) * 1000)
+                    first = False
+                yield text
+            self.record_usage(chunk)
+
+    def pop_stream_result(self, session_id):
+        return self.stream_results.pop(session_id)
+
+    def end_session(self, session_id):
+        """Drop all state kept for a session (history, full chat, prefetch, pending and latest summary)."""
+        for store in (self.store, self.full_chat_session, self.prefetched, self.pending_compactions, self.summary_checkpoints):
+            store.pop(session_id, None)
+        self.stream_results.pop(session_id, None)
+
+    def session_store_stats(self):
+        """Footprint and eviction counters of the per-session stores."""
+        return [
+            self.store.stats(), self.full_chat_session.stats(), self.prefetched.stats(),
+            self.pending_compactions.stats(), self.summary_checkpoints.stats(),
+        ]
     
 if __name__=="__main__":
 
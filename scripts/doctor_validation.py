@@ -1,8 +1,9 @@
-from langchain.schema import SystemMessage, HumanMessage
-import yaml
+from langchain_core.messages import SystemMessage, HumanMessage
 
 from medical_data_store import MedicalDataStore
 from bedrock_initializer import BedrockModel
+from prompt_loader import load_prompts
+from telemetry import traced
 
 class SummarizeValidatedReport(BedrockModel):
 
@@ -13,15 +14,13 @@ class SummarizeValidatedReport(BedrockModel):
         # accessing bedrock model from it self.llm_chat
         super().__init__(**kwargs) 
 
-        # Load prompts
-        # prompts_path = "prompts.yaml"
-        prompts_path = "/app/scripts/prompts.yaml"
-        with open(prompts_path, 'r') as f:
-            prompts = yaml.safe_load(f)
+        # Load prompts (parsed once per process)
+        prompts = load_prompts()
 
         # # Access prompts
         self.doc_validation_prompt = prompts['medical_assistant']['summarizing_doctor_validated_report']
         
+    @traced("validation_store")
     def summarize_doctor_validated_report(self, report):
 
         print("____________________________________\n")
@@ -30,11 +29,12 @@ class SummarizeValidatedReport(BedrockModel):
         # 1️⃣ Run LLM to extract structured summary
 
         if report and isinstance(report, str):
-            input_llm = self.doc_validation_prompt + "\n" + report
-            llm_response = self.llm_chat.invoke([
+            # the fixed instructions come first and are cached; only the report changes per call
+            input_llm = self.cacheable_content(self.doc_validation_prompt, report)
+            llm_response = self.invoke_llm([
                 SystemMessage(content="You are a helpful medical assistant."),
                 HumanMessage(content=input_llm)
-            ])
+            ], call_type="validation")
 
         formatted_output = llm_response.content.strip()
         print("\n=== FORMATTED OUTPUT ===")
@@ -0,0 +1,147 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+class EmbeddingCache:
+    """
+    A disk-backed, content-addressed cache for embedding vectors.
+
+    Entries are keyed by (model id, hash of the whitespace-normalized text), stored in SQLite
+    and evicted least-recently-used first once the cache grows past max_entries. Hits only
+    record their access time in memory; the times are written in one batch on the next put, or
+    once access_flush_size of them are pending, so lookups never write to the database.
+    """
+    def __init__(self,
+        cache_path: str = None,
+        max_entries: int = None,
+        access_flush_size: int = None,
+        ):
+
+        self.cache_path = cache_path or os.getenv("EMBEDDING_CACHE_PATH", "/app/cache/embeddings.sqlite")
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000))
+        self.access_flush_size = access_flush_size or int(os.getenv("EMBEDDING_CACHE_ACCESS_FLUSH_SIZE", 1000))
+
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # one connection shared by the ingestion worker threads, serialized by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._pending_access = {}  # key -> last hit time not yet written to last_access
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_id: str, text: str):
+        """Build the cache key from the model id and the normalized text."""
+        normalized = " ".join(text.split())
+        text_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{model_id}:{text_hash}"
+
+    def get(self, model_id: str, text: str):
+        """Return the cached vector as a list of floats, or None on a miss."""
+        key = self.make_key(model_id, text)
+
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._pending_access[key] = time.time()
+            self.hits += 1
+            if len(self._pending_access) >= self.access_flush_size:
+                self._flush_access()
+                self._conn.commit()
+
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def _flush_access(self):
+        # caller holds the lock and commits
+        if self._pending_access:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._pending_access.items()]
+            )
+            self._pending_access.clear()
+
+    def flush(self):
+        """Write the access times of recent hits, so LRU eviction sees them."""
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+
+    def put(self, model_id: str, text: str, vector):
+        """Store a vector, evicting the least recently used entries past the size cap."""
+        key = self.make_key(model_id, text)
+        blob = array("f", vector).tobytes()
+
+        with self._lock:
+            self._flush_access()
+            exists = self._conn.execute("SELECT 1 FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                (key, blob, time.time())
+            )
+            if not exists:
+                self._size += 1
+
+            if self._size > self.max_entries:
+                # trim to 90% of the cap so eviction does not run on every insert
+                excess = self._size - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (excess,)
+                )
+                self._size -= excess
+
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current number of cached vectors."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._pending_access.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+
+if __name__ == "__main__":
+
+    cache = EmbeddingCache(cache_path="/tmp/embeddings_test.sqlite", max_entries=10)
+    cache.put("test-model", "throbbing  headache", [0.1, 0.2, 0.3])
+    print(cache.get("test-model", "throbbing headache"))
+    print(cache.get("test-model", "nausea"))
+    print(cache.stats())
@@ -0,0 +1,99 @@
+import re
+import math
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str):
+    """Lowercased alphanumeric tokens, the same analysis for documents and queries."""
+    return _TOKEN_RE.findall(text.lower()) if isinstance(text, str) else []
+
+
+class BM25Index:
+    """
+    Incremental Okapi BM25 index for backends that do not score text themselves.
+
+    Uses the same k1 / b defaults as OpenSearch's BM25 similarity so lexical scores from
+    the local and the OpenSearch backend rank documents the same way.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+
+        self.k1 = k1
+        self.b = b
+
+        self.term_freqs = {}     # doc_id -> Counter of terms
+        self.doc_lengths = {}    # doc_id -> number of tokens
+        self.doc_freqs = Counter()
+        self.postings = {}       # term -> set of doc_ids
+        self.total_length = 0
+
+    def add(self, doc_id, text: str):
+        if doc_id in self.term_freqs:
+            self.remove(doc_id)
+
+        tokens = tokenize(text)
+        freqs = Counter(tokens)
+
+        self.term_freqs[doc_id] = freqs
+        self.doc_lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+        for term in freqs:
+            self.doc_freqs[term] += 1
+            self.postings.setdefault(term, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        freqs = self.term_freqs.pop(doc_id, None)
+        if freqs is None:
+            return
+
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in freqs:
+            self.doc_freqs[term] -= 1
+            self.postings[term].discard(doc_id)
+            if not self.doc_freqs[term]:
+                del self.doc_freqs[term]
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 10):
+        """Top-k (doc_id, score) pairs for the query, best first."""
+        n_docs = len(self.term_freqs)
+        if not n_docs:
+            return []
+
+        avg_length = self.total_length / n_docs
+        scores = Counter()
+
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            df = self.doc_freqs[term]
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+            for doc_id in self.postings[term]:
+                tf = self.term_freqs[doc_id][term]
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return scores.most_common(k)
+
+
+def reciprocal_rank_fusion(rankings, k: int = 10, rank_constant: int = 60):
+    """
+    Fuse several ranked hit lists by reciprocal rank.
+
+    Each ranking is a list of OpenSearch-style hits carrying an "_id". A document scores
+    sum(1 / (rank_constant + rank)) over the rankings it appears in; the fused hits keep
+    the first source seen for the document and the RRF score as "_score".
+    """
+    scores = {}
+    hits_by_id = {}
+
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            doc_id = hit["_id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rank_constant + rank)
+            hits_by_id.setdefault(doc_id, hit)
+
+    fused = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [dict(hits_by_id[doc_id], _score=scores[doc_id]) for doc_id in fused]
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+class LLMResponseCache:
+    """
+    Two-level (memory + SQLite) cache of chat model responses with LRU and TTL eviction.
+
+    Entries are keyed by model id, model kwargs and a hash of the message list, so a retry,
+    a Streamlit rerun or a replay of the same temperature-0 call is answered without Bedrock.
+    Hit/miss counters are kept per agent.
+    """
+    def __init__(self,
+        cache_path: str = None,
+        max_memory_entries: int = None,
+        max_disk_entries: int = None,
+        ttl_seconds: float = None,
+        ):
+
+        self.cache_path = cache_path or os.getenv("LLM_CACHE_PATH", "/app/cache/llm_responses.sqlite")
+        self.max_memory_entries = max_memory_entries or int(os.getenv("LLM_CACHE_MAX_MEMORY_ENTRIES", 256))
+        self.max_disk_entries = max_disk_entries or int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", 5000))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("LLM_CACHE_TTL_SECONDS", 24 * 3600))
+
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (created_at, content)
+
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+        self.agent_stats = {}  # agent name -> {"hits": n, "misses": n}
+
+    @staticmethod
+    def make_key(model_id: str, model_kwargs: dict, messages):
+        """Hash of the model id, its kwargs and the (type, content) of every message."""
+        payload = json.dumps(
+            {
+                "model_id": model_id,
+                "model_kwargs": model_kwargs or {},
+                "messages": [(message.type, message.content) for message in messages],
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, agent: str, hit: bool):
+        stats = self.agent_stats.setdefault(agent, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+
+    def _remember(self, key, created_at, content):
+        self._memory[key] = (created_at, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str, agent: str = "default"):
+        """Return the cached response text, or None when missing or expired."""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, content = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._count(agent, True)
+                    return content
+                del self._memory[key]
+
+            row = self._conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self._count(agent, False)
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, row[1], row[0])
+            self._count(agent, True)
+            return row[0]
+
+    def put(self, key: str, content: str):
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, content)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, content, now, now)
+            )
+
+            # expire old entries, then trim the least recently used ones past the cap
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Per-agent hits, misses and hit rate."""
+        with self._lock:
+            return {
+                agent: dict(counts, hit_rate=counts["hits"] / (counts["hits"] + counts["misses"]))
+                for agent, counts in self.agent_stats.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.agent_stats = {}
@@ -1,24 +1,36 @@
 import os
 import re
-import boto3
 from dotenv import load_dotenv
-from opensearchpy import OpenSearch
 import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from s3_bucket import S3DataBucket
-from tqdm import tqdm
+from embedding_cache import EmbeddingCache
+from vector_backends import create_vector_backend
+from client_registry import get_bedrock_runtime_client, get_opensearch_client, get_shared, is_offline_mode
+from telemetry import span
 
 class MedicalDataStore:
 
     def __init__(self):
 
-        self.s3_obj = S3DataBucket()
+        self._s3_obj = None  # S3 is only needed for ingestion, see s3_obj
 
         """Initialize embedding + OpenSearch connection."""
         load_dotenv(dotenv_path="/app/.env")
 
-        self.bedrock = boto3.client("bedrock-runtime")  # IAM must allow bedrock:InvokeModel
+        self.bedrock = get_bedrock_runtime_client()  # IAM must allow bedrock:InvokeModel
         self.index_name = "medical-embeddings"
 
+        # ingestion tuning (embedding worker pool + _bulk batch size)
+        self.ingest_max_workers = int(os.getenv("INGEST_MAX_WORKERS", 8))
+        self.ingest_batch_size = int(os.getenv("INGEST_BATCH_SIZE", 100))
+        self.ingest_checkpoint_seconds = float(os.getenv("INGEST_CHECKPOINT_SECONDS", 30))
+
+        # per-row content hashes of the last ingestion, used for delta refreshes
+        self.manifest_path = os.getenv("INGEST_MANIFEST_PATH", "/app/cache/ingest_manifest.json")
+
         # AWS setup
         self.region = os.getenv("AWS_REGION")
         self.host = os.getenv("AWS_OPENSEARCH_HOST")
@@ -26,12 +38,20 @@ class MedicalDataStore:
         self.username = os.getenv("AWS_OPENSEARCH_USERNAME")
         self.password = os.getenv("AWS_OPENSEARCH_PASSWORD")
 
-        self.opensearch = OpenSearch(
-            hosts=[{"host": self.host, "port": 443}],
-            http_auth=(self.username, self.password),
-            use_ssl=True,
-            verify_certs=True
-            )
+        # fake vectors get their own cache namespace, never mixed with real Titan embeddings
+        if is_offline_mode():
+            self.embedding_model = f"offline/{self.embedding_model}"
+
+        self.vector_backend = os.getenv("VECTOR_BACKEND", "opensearch").lower()
+
+        self.opensearch = None
+        if self.vector_backend == "opensearch":
+            self.opensearch = get_opensearch_client()
+
+        # content-addressed embedding cache shared by ingestion, search and validated reports
+        self.embedding_cache = None
+        if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true":
+            self.embedding_cache = get_shared(("embedding_cache",), EmbeddingCache)
         
         self.index_body = {
             "settings": {"index": {"knn": True}},
@@ -49,58 +69,212 @@ class MedicalDataStore:
             }
         }
 
-        if not self.opensearch.indices.exists(index=self.index_name):
-            self.opensearch.indices.create(index=self.index_name, body=self.index_body)
+        # pluggable vector store: OpenSearch k-NN index or in-process NumPy matrix,
+        # shared process-wide so the index-existence check runs only once
+        self.vector_store = get_shared(
+            ("vector_store", self.vector_backend, self.index_name),
+            lambda: create_vector_backend(
+                backend=self.vector_backend,
+                opensearch_client=self.opensearch,
+                index_name=self.index_name,
+                index_body=self.index_body
+            )
+        )
+
+    @property
+    def s3_obj(self):
+        if self._s3_obj is None:
+            self._s3_obj = S3DataBucket()
+        return self._s3_obj
 
     def get_embedding(self, text: str):
 
         if not isinstance(text, str) or text.strip() == "":
             raise ValueError("Input text must be a non-empty string")
-        
-        payload = {"inputText": text}  # MUST be 'input_text'
-        
-        response = self.bedrock.invoke_model(
-            modelId=self.embedding_model,   # embedding model
-            body=json.dumps(payload),
-            contentType="application/json"
-        )
-        
-        result = json.loads(response["body"].read())
-        return result["embedding"]  # list of floats
+
+        with span("embed") as stage:
+            if self.embedding_cache is not None:
+                cached = self.embedding_cache.get(self.embedding_model, text)
+                if cached is not None:
+                    stage.set(cached=True)
+                    return cached
+            stage.set(cached=False)
+
+            payload = {"inputText": text}  # MUST be 'input_text'
+
+            response = self.bedrock.invoke_model(
+                modelId=self.embedding_model,   # embedding model
+                body=json.dumps(payload),
+                contentType="application/json"
+            )
+
+            result = json.loads(response["body"].read())
+            embedding = result["embedding"]  # list of floats
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(self.embedding_model, text, embedding)
+
+        return embedding
+
+    def get_embeddings(self, texts, max_workers=None):
+        """Embed several texts concurrently (duplicates embedded once), preserving input order."""
+        max_workers = max_workers or self.ingest_max_workers
+        unique_texts = list(dict.fromkeys(texts))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            embeddings = dict(zip(unique_texts, executor.map(self.get_embedding, unique_texts)))
+
+        return [embeddings[text] for text in texts]
+
+    def embedding_cache_stats(self):
+        """Hit/miss counters of the embedding cache (None when caching is disabled)."""
+        if self.embedding_cache is None:
+            return None
+        return self.embedding_cache.stats()
 
     # -------------------- DATA STORAGE --------------------
-    def store_in_vectordb(self):
+    @staticmethod
+    def content_hash(text: str):
+        """Hash of the whitespace-normalized text."""
+        return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def document_id(disease: str, text: str):
+        """Stable document id derived from the disease name and the row content."""
+        slug = re.sub(r"[^a-z0-9]+", "-", str(disease).lower()).strip("-")
+        digest = hashlib.sha256(f"{disease}\x1f{MedicalDataStore.content_hash(text)}".encode("utf-8")).hexdigest()
+        return f"{slug}-{digest[:16]}"
+
+    def load_manifest(self):
+        """
+        Return {document id: {disease, content_hash}} from the last ingestion, or None.
+
+        None as well when the index no longer holds as many CSV rows as the manifest lists
+        (index or local store wiped or recreated), so the caller falls back to a full refresh.
+        """
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("index_name") != self.index_name or manifest.get("backend") != self.vector_backend:
+            return None
+
+        self.vector_store.refresh()
+        indexed = self.vector_store.count_by_source("original_data")
+        if indexed != len(manifest["documents"]):
+            print(f"=== Manifest lists {len(manifest['documents'])} rows but the index holds {indexed}, full refresh ===")
+            return None
+        return manifest["documents"]
+
+    def save_manifest(self, documents):
+        manifest_dir = os.path.dirname(self.manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"index_name": self.index_name, "backend": self.vector_backend, "documents": documents}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def checkpoint(self, manifest):
+        """Persist the vector store, then the manifest describing it."""
+        self.vector_store.flush()
+        self.save_manifest(manifest)
+
+    def store_in_vectordb(self, max_workers=None, batch_size=None, full_refresh=False):
+
+        """
+        Load CSV from S3 and sync it into the vector store.
+
+        Only rows that are new or changed since the last run are embedded and upserted under
+        stable ids, rows that disappeared from the CSV are deleted. Without a manifest (first
+        run, or full_refresh=True) every previously ingested CSV row is replaced.
+        """
+        from tqdm import tqdm  # progress bar for bulk ingestion only
+
+        max_workers = max_workers or self.ingest_max_workers
+        batch_size = batch_size or self.ingest_batch_size
 
-        """Load CSV from S3, embed, and store in OpenSearch."""
         df = self.s3_obj.s3_get_data()
 
         if "disease" not in df.columns or "combined_text" not in df.columns:
             raise ValueError("CSV must have 'disease' and 'combined_text' columns.")
-        
-        for _, row in tqdm(df.iterrows(), total=len(df)):
-            text = row["combined_text"]
 
+        current = {}
+        for _, row in df.iterrows():
+            text = row["combined_text"]
             if not isinstance(text, str) or text.strip() == "":
                 continue  # skip empty rows
-            emb = self.get_embedding(text)
-
-            doc = {
-                "disease": row["disease"],
-                "combined_text": text,
-                "embedding": emb,
-                "metadata": {
-                    "source": "original_data",
-                }
-            }
+            current[self.document_id(row["disease"], text)] = (row["disease"], text)
+
+        manifest = None if full_refresh else self.load_manifest()
+
+        if manifest is None:
+            # unknown previous state: drop earlier CSV rows (incl. auto-id ones), keep validated reports
+            removed_cnt = self.vector_store.delete_by_source("original_data")
+            manifest = {}
+        else:
+            removed_ids = [doc_id for doc_id in manifest if doc_id not in current]
+            removed_cnt = self.vector_store.delete_documents(removed_ids, batch_size=batch_size)
+            for doc_id in removed_ids:
+                manifest.pop(doc_id)
+
+        pending = [(doc_id, disease, text) for doc_id, (disease, text) in current.items() if doc_id not in manifest]
+
+        start = time.perf_counter()
+        last_checkpoint = start
+        indexed = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor, tqdm(total=len(pending)) as progress:
+            for i in range(0, len(pending), batch_size):
+                batch = pending[i:i + batch_size]
+                embeddings = executor.map(self.get_embedding, [text for _, _, text in batch])
+
+                docs = [
+                    {
+                        "disease": disease,
+                        "combined_text": text,
+                        "embedding": emb,
+                        "metadata": {
+                            "source": "original_data",
+                        }
+                    }
+                    for (_, disease, text), emb in zip(batch, embeddings)
+                ]
+
+                indexed += self.vector_store.add_documents(docs, ids=[doc_id for doc_id, _, _ in batch], batch_size=batch_size)
 
-            self.opensearch.index(index=self.index_name, body=doc)
+                for doc_id, disease, text in batch:
+                    manifest[doc_id] = {"disease": disease, "content_hash": self.content_hash(text)}
+                progress.update(len(batch))
 
-        print(" === Data stored in OpenSearch ===")
+                # periodic checkpoint so an interrupted run resumes from here without
+                # rewriting the whole store and manifest after every batch
+                if time.perf_counter() - last_checkpoint >= self.ingest_checkpoint_seconds:
+                    self.checkpoint(manifest)
+                    last_checkpoint = time.perf_counter()
+
+        self.checkpoint(manifest)
+
+        elapsed = time.perf_counter() - start
+        rate = indexed / elapsed if elapsed > 0 else 0.0
+
+        print(f" === Data stored in {self.vector_backend} vector store ===")
+        print(f"Upserted {indexed} rows, deleted {removed_cnt}, unchanged {len(current) - len(pending)}")
+        print(f"Indexed {indexed} rows in {elapsed:.1f}s ({rate:.1f} rows/sec)")
+
+        return {
+            "indexed": indexed,
+            "deleted": removed_cnt,
+            "unchanged": len(current) - len(pending),
+            "seconds": elapsed,
+            "rows_per_sec": rate
+        }
 
     # -------------------- VALIDATED REPORT STORAGE --------------------
     def store_validated_report(self, formatted_output: str):
 
-        """Store doctor-validated text into OpenSearch."""
+        """Store doctor-validated text into the vector store."""
         match = re.search(r"Disease:\s*(.*?)\s*\|", formatted_output)
         disease_name = match.group(1).strip() if match else "Unknown"
 
@@ -117,15 +291,18 @@ class MedicalDataStore:
 
 
         collection_cnt = {}
-        before_adding = self.opensearch.count(index=self.index_name)
-        collection_cnt["before_adding"] = before_adding["count"]
+        with span("vector_store_write", documents=1):
+            before_adding = self.vector_store.count()
+            collection_cnt["before_adding"] = before_adding
 
-        self.opensearch.index(index=self.index_name, body=doc)
+            # stable id, so saving the same validated report twice does not duplicate it
+            self.vector_store.add_documents([doc], ids=[self.document_id(disease_name, formatted_output)])
 
-        self.opensearch.indices.refresh(index=self.index_name)
+            self.vector_store.flush()
+            self.vector_store.refresh()
 
-        after_adding = self.opensearch.count(index=self.index_name)
-        collection_cnt["after_adding"] = after_adding["count"]
+            after_adding = self.vector_store.count()
+            collection_cnt["after_adding"] = after_adding
 
         print(f"✅ Added doctor-validated report for {disease_name}")
 
@@ -136,27 +313,20 @@ class MedicalDataStore:
         return collection_cnt
 
     # -------------------- RETRIEVAL --------------------
-    def similarity_search(self, query: str, k: int = 1):
+    def similarity_search(self, query: str, k: int = 1, mode: str = None):
 
-        """Retrieve top-k relevant chunks."""
+        """Retrieve top-k relevant chunks ('knn' or 'hybrid' BM25 + k-NN, default RETRIEVAL_MODE)."""
         query_emb = self.get_embedding(query)
 
-        query = {
-            "size": k,
-            "query": {
-                "knn": {
-                    "embedding": {
-                        "vector": query_emb,
-                        "k": k
-                    }
-                }
-            }
-        }
-
-        response = self.opensearch.search(index=self.index_name, body=query)
+        mode = (mode or os.getenv("RETRIEVAL_MODE", "knn")).lower()
+        with span("search", mode=mode, k=k):
+            if mode == "hybrid":
+                response = self.vector_store.hybrid_search(query, query_emb, k=k)
+            else:
+                response = self.vector_store.knn_search(query_emb, k=k)
 
-        cnt = self.opensearch.count(index=self.index_name)
-        print(f"Number of chunks - {cnt['count']}")
+        cnt = self.vector_store.count()
+        print(f"Number of chunks - {cnt}")
 
         # results = response["hits"]["hits"][0]["_source"]["combined_text"]
         
@@ -0,0 +1,56 @@
+import os
+import json
+from functools import lru_cache
+
+# model_routing.json ships next to the agents (/app/scripts in the container)
+MODEL_ROUTING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_routing.json")
+
+
+@lru_cache(maxsize=None)
+def load_model_routing(routing_path: str = None):
+    """
+    Parsed model routing, read once per process (do not mutate).
+
+    Environment overrides on top of the file:
+        BEDROCK_MODEL_<TIER>     model id / inference-profile ARN of a tier (e.g. BEDROCK_MODEL_FAST)
+        MODEL_ROUTES             "Agent.call_type=tier,Agent=tier", e.g. "ConversationAgent.chat=strong"
+        MODEL_FALLBACK_ENABLED   "false" to fail instead of retrying on the fallback tier
+    """
+    with open(routing_path or os.getenv("MODEL_ROUTING_PATH", MODEL_ROUTING_PATH), "r", encoding="utf-8") as f:
+        routing = json.load(f)
+
+    routing["tiers"] = {
+        tier: os.getenv(f"BEDROCK_MODEL_{tier.upper()}", model_id) for tier, model_id in routing["tiers"].items()
+    }
+    for override in filter(None, os.getenv("MODEL_ROUTES", "").split(",")):
+        route, tier = override.split("=", 1)
+        routing["routes"][route.strip()] = tier.strip()
+    if os.getenv("MODEL_FALLBACK_ENABLED", "true").lower() != "true":
+        routing["fallback"] = {}
+
+    referenced = list(routing["routes"].values()) + list(routing["fallback"].values()) + [routing["default"]]
+    unknown = {tier for tier in referenced if tier not in routing["tiers"]}
+    if unknown:
+        raise ValueError(f"Model routing refers to unknown tiers: {sorted(unknown)}")
+    return routing
+
+
+def resolve_tier(agent: str, call_type: str = None, routing: dict = None):
+    """Tier of an agent's call type: "Agent.call_type" route, then "Agent" route, then the default."""
+    routing = routing or load_model_routing()
+    routes = routing["routes"]
+    if call_type and f"{agent}.{call_type}" in routes:
+        return routes[f"{agent}.{call_type}"]
+    return routes.get(agent, routing["default"])
+
+
+def resolve_models(agent: str, call_type: str = None, routing: dict = None):
+    """[(tier, model id)] to try in order: the routed tier, then its fallback chain."""
+    routing = routing or load_model_routing()
+    tier = resolve_tier(agent, call_type, routing)
+
+    chain = []
+    while tier and tier not in (t for t, _ in chain):
+        chain.append((tier, routing["tiers"][tier]))
+        tier = routing["fallback"].get(tier)
+    return chain
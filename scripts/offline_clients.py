@@ -0,0 +1,517 @@
+"""
+Offline stand-ins for the Bedrock runtime, S3 and OpenSearch clients.
+
+With OFFLINE_MODE=true the client registry hands these out instead of boto3 / opensearch-py
+clients, so MedicalPipeline, the Streamlit app and the API run on a dev box or in CI:
+
+- FakeBedrockRuntime: invoke_model / invoke_model_with_response_stream in the Bedrock wire
+  format. Titan embedding requests get a deterministic hash-based (feature hashing) vector, so
+  texts sharing words are close; Anthropic messages requests get a scripted reply.
+- FakeS3Client: get_object / upload_file against a local directory (OFFLINE_S3_ROOT, default
+  the repository root, so data/medical_data.csv is found).
+- FakeOpenSearch: in-memory k-NN / BM25 index (NumpyBackend per index) behind the subset of
+  the OpenSearch API that OpenSearchBackend uses. New indices are seeded from
+  OFFLINE_SEED_CSV (default data/medical_data.csv) unless it is set to "".
+
+Latency and errors are injected per operation (embed, chat, search, s3):
+
+    OFFLINE_LATENCY_P50_MS / OFFLINE_LATENCY_P99_MS     log-normal latency, all operations
+    OFFLINE_CHAT_LATENCY_P50_MS ...                      per-operation override
+    OFFLINE_STREAM_CHUNK_MS                              delay between streamed chunks
+    OFFLINE_ERROR_RATE / OFFLINE_<OP>_ERROR_RATE         fraction of calls failing (throttling)
+    OFFLINE_SEED                                         seed of the latency / error draws
+
+Prompt caching is emulated: a request prefix ending at a cache_control checkpoint is remembered
+for OFFLINE_PROMPT_CACHE_TTL_S (default 300, refreshed on hits) once it reaches
+OFFLINE_PROMPT_CACHE_MIN_TOKENS (default 1024), and cache-read / cache-write token counts are
+returned where Bedrock reports them. OFFLINE_PREFILL_MS_PER_1K_TOKENS adds prompt-size dependent
+time to first token, with cached tokens costing a tenth of that.
+
+System prompts that ask for tagged sections (<clinical_summary>...</clinical_summary>) get the
+reply wrapped in each of them.
+
+Chat replies come from OFFLINE_CHAT_SCRIPT, a JSON file holding either a list of replies
+(returned in turn) or a list of {"match": "<regex>", "response": "..."} rules tried against
+the latest user message, or from FakeBedrockRuntime.set_chat_script() in-process.
+"""
+
+import io
+import os
+import re
+import csv
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+
+from lexical_search import tokenize
+from token_budget import estimate_tokens
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_EMBEDDING_DIMENSION = 1024
+
+DEFAULT_REPLIES = [
+    "Thank you for sharing that. How long have you had these symptoms?",
+    "I understand. On a scale of 1 to 10, how severe is it?",
+    "Have you noticed anything that makes it better or worse?",
+    "Are you experiencing any other symptoms, such as fever or nausea?",
+    "Are you currently taking any medication for this?",
+]
+
+
+class FaultInjector:
+    """Latency and error draws for fake calls, configured through OFFLINE_* environment variables."""
+    def __init__(self, seed=None):
+
+        seed = seed if seed is not None else os.getenv("OFFLINE_SEED")
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _setting(operation: str, name: str, default: float):
+        value = os.getenv(f"OFFLINE_{operation.upper()}_{name}", os.getenv(f"OFFLINE_{name}"))
+        return float(value) if value not in (None, "") else default
+
+    def sample_latency(self, operation: str):
+        """Seconds to wait: log-normal with the configured p50 and p99."""
+        p50 = self._setting(operation, "LATENCY_P50_MS", 0.0)
+        if p50 <= 0:
+            return 0.0
+        p99 = max(self._setting(operation, "LATENCY_P99_MS", p50), p50)
+        sigma = math.log(p99 / p50) / 2.326  # z-score of the 99th percentile
+
+        with self._lock:
+            return self.random.lognormvariate(math.log(p50), sigma) / 1000
+
+    def __call__(self, operation: str, error_factory):
+        """Sleep for a sampled latency, then raise error_factory() at the configured error rate."""
+        delay = self.sample_latency(operation)
+        if delay:
+            time.sleep(delay)
+
+        error_rate = self._setting(operation, "ERROR_RATE", 0.0)
+        if error_rate > 0:
+            with self._lock:
+                failed = self.random.random() < error_rate
+            if failed:
+                raise error_factory()
+
+
+def fake_embedding(text: str, dimension: int = DEFAULT_EMBEDDING_DIMENSION):
+    """Deterministic unit vector from hashed word features (texts sharing words are similar)."""
+    vector = [0.0] * dimension
+    features = tokenize(text) or [text]
+
+    for feature in features:
+        digest = hashlib.sha256(feature.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimension
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _throttling_error(operation_name: str):
+    from botocore.exceptions import ClientError
+    return ClientError(
+        {"Error": {"Code": "ThrottlingException", "Message": "Too many requests (offline fault injection)"}},
+        operation_name,
+    )
+
+
+class FakePromptCache:
+    """Bedrock prompt-cache emulation: prefixes ending at a cache_control checkpoint, with TTL."""
+
+    LOOKBACK_BLOCKS = 20  # block boundaries before a checkpoint checked for a cached prefix
+
+    def __init__(self, ttl_seconds: float = None, min_tokens: int = None):
+
+        self.ttl_seconds = ttl_seconds or float(os.getenv("OFFLINE_PROMPT_CACHE_TTL_S", 300))
+        self.min_tokens = min_tokens if min_tokens is not None else int(os.getenv("OFFLINE_PROMPT_CACHE_MIN_TOKENS", 1024))
+        self._lock = threading.Lock()
+        self._expires = {}  # prefix hash -> expiry time
+
+    @staticmethod
+    def _blocks(content):
+        if isinstance(content, str):
+            return [{"type": "text", "text": content}] if content else []
+        return [block for block in content or [] if isinstance(block, dict)]
+
+    def boundaries(self, request):
+        """([(prefix hash, prefix tokens, is checkpoint)] after every content block, total prompt tokens)."""
+        segments = [("system", block) for block in self._blocks(request.get("system"))]
+        for message in request.get("messages", []):
+            segments += [(message.get("role"), block) for block in self._blocks(message.get("content"))]
+
+        prefix, tokens, boundaries = hashlib.sha256(), 0, []
+        for role, block in segments:
+            text = block.get("text", "")
+            prefix.update(json.dumps([role, text]).encode("utf-8"))
+            tokens += estimate_tokens(text)
+            boundaries.append((prefix.hexdigest(), tokens, bool(block.get("cache_control"))))
+        return boundaries, tokens
+
+    def lookup(self, request):
+        """(uncached input, cache read, cache write) tokens; stores new checkpoints as Bedrock would."""
+        boundaries, total = self.boundaries(request)
+        last_checkpoint = max((i for i, boundary in enumerate(boundaries) if boundary[2]), default=-1)
+
+        now = time.time()
+        read, written = 0, 0
+        with self._lock:
+            self._expires = {key: expiry for key, expiry in self._expires.items() if expiry > now}
+
+            # like Bedrock, earlier block boundaries are checked for a hit too, so the checkpoint
+            # written on the previous turn of a conversation is found from the new, longer request
+            for key, tokens, _ in reversed(boundaries[:last_checkpoint + 1][-self.LOOKBACK_BLOCKS:]):
+                if key in self._expires:
+                    read = tokens
+                    self._expires[key] = now + self.ttl_seconds
+                    break
+
+            for key, tokens, checkpoint in boundaries[:last_checkpoint + 1]:
+                if checkpoint and tokens > read and tokens >= self.min_tokens:
+                    self._expires[key] = now + self.ttl_seconds
+                    written = tokens - read
+
+        return total - read - written, read, written
+
+
+class FakeBedrockRuntime:
+    """bedrock-runtime client answering Titan embedding and Anthropic messages requests locally."""
+    def __init__(self, faults: FaultInjector = None):
+
+        self.faults = faults or FaultInjector()
+        self.prompt_cache = FakePromptCache()
+        self._lock = threading.Lock()
+        self.calls = {"embed": 0, "chat": 0, "stream": 0}
+
+        self._script = None
+        self._script_position = 0
+        script_path = os.getenv("OFFLINE_CHAT_SCRIPT")
+        if script_path:
+            with open(script_path, "r", encoding="utf-8") as f:
+                self.set_chat_script(json.load(f))
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            return self.calls[kind]
+
+    def set_chat_script(self, script):
+        """Replies as a list of strings, a list of {"match", "response"} rules, or a callable(request body)."""
+        with self._lock:
+            self._script = script
+            self._script_position = 0
+
+    # -------------------- RESPONSES --------------------
+    @staticmethod
+    def _text_of(content):
+        if isinstance(content, str):
+            return content
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+    def _reply(self, request):
+        messages = request.get("messages", [])
+        user_messages = [self._text_of(m.get("content", "")) for m in messages if m.get("role") == "user"]
+        last_user = user_messages[-1] if user_messages else ""
+
+        with self._lock:
+            script = self._script
+            if callable(script):
+                return script(request)
+
+            if script and all(isinstance(item, str) for item in script):
+                reply = script[self._script_position % len(script)]
+                self._script_position += 1
+                return reply
+
+            for rule in script or []:
+                if re.search(rule["match"], last_user, flags=re.IGNORECASE):
+                    return rule["response"]
+
+        # deterministic default, so the LLM response cache behaves as with a temperature-0 model
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).digest()
+        return DEFAULT_REPLIES[digest[0] % len(DEFAULT_REPLIES)]
+
+    @classmethod
+    def _format_reply(cls, request, reply):
+        """Answer inside the <tag>...</tag> sections a system prompt lays out, as a format-following model would."""
+        system = cls._text_of(request.get("system") or "")
+        tags = [
+            tag for tag in dict.fromkeys(re.findall(r"^\s*<([a-z_]+)>\s*$", system, flags=re.MULTILINE))
+            if f"</{tag}>" in system and f"<{tag}>" not in reply
+        ]
+        return "\n".join(f"<{tag}>\n{reply}\n</{tag}>" for tag in tags) or reply
+
+    @staticmethod
+    def _prefill(input_tokens, cache_read_tokens):
+        """Prompt-size dependent time to first token; cached tokens cost a tenth."""
+        ms_per_1k = float(os.getenv("OFFLINE_PREFILL_MS_PER_1K_TOKENS", 0))
+        if ms_per_1k > 0:
+            time.sleep((input_tokens + 0.1 * cache_read_tokens) / 1000 * ms_per_1k / 1000)
+
+    # -------------------- CLIENT API --------------------
+    def invoke_model(self, modelId=None, body=None, contentType=None, accept=None, **kwargs):
+        request = json.loads(body)
+
+        if "inputText" in request:
+            self.faults("embed", lambda: _throttling_error("InvokeModel"))
+            self._count("embed")
+            dimension = request.get("dimensions", DEFAULT_EMBEDDING_DIMENSION)
+            payload = {
+                "embedding": fake_embedding(request["inputText"], dimension),
+                "inputTextTokenCount": estimate_tokens(request["inputText"]),
+            }
+            return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+        self.faults("chat", lambda: _throttling_error("InvokeModel"))
+        call_number = self._count("chat")
+        input_tokens, cache_read, cache_write = self.prompt_cache.lookup(request)
+        self._prefill(input_tokens + cache_write, cache_read)
+        text = self._format_reply(request, self._reply(request))
+        output_tokens = estimate_tokens(text)
+        payload = {
+            "id": f"msg_offline_{call_number}",
+            "type": "message",
+            "role": "assistant",
+            "model": modelId,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": input_tokens, "output_tokens": output_tokens,
+                "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_write,
+            },
+        }
+        return {
+            "body": io.BytesIO(json.dumps(payload).encode("utf-8")),
+            "ResponseMetadata": {"HTTPHeaders": {
+                "x-amzn-bedrock-input-token-count": str(input_tokens),
+                "x-amzn-bedrock-output-token-count": str(output_tokens),
+                "x-amzn-bedrock-cache-read-input-token-count": str(cache_read),
+                "x-amzn-bedrock-cache-write-input-token-count": str(cache_write),
+            }},
+        }
+
+    def invoke_model_with_response_stream(self, modelId=None, body=None, contentType=None, accept=None, **kwargs):
+        request = json.loads(body)
+
+        # time to first token; the events below are produced lazily like a real event stream
+        self.faults("chat", lambda: _throttling_error("InvokeModelWithResponseStream"))
+        self._count("stream")
+        input_tokens, cache_read, cache_write = self.prompt_cache.lookup(request)
+        self._prefill(input_tokens + cache_write, cache_read)
+        text = self._format_reply(request, self._reply(request))
+        output_tokens = estimate_tokens(text)
+        chunk_delay = float(os.getenv("OFFLINE_STREAM_CHUNK_MS", 0)) / 1000
+
+        def event(payload):
+            return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+
+        def events():
+            yield event({"type": "message_start", "message": {
+                "role": "assistant", "content": [], "model": modelId,
+                "usage": {"input_tokens": input_tokens, "output_tokens": 0,
+                          "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_write},
+            }})
+            yield event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            for piece in re.findall(r"\S+\s*|\s+", text):
+                if chunk_delay:
+                    time.sleep(chunk_delay)
+                yield event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})
+            yield event({"type": "content_block_stop", "index": 0})
+            yield event({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                         "usage": {"output_tokens": output_tokens}})
+            yield event({"type": "message_stop", "amazon-bedrock-invocationMetrics": {
+                "inputTokenCount": input_tokens, "outputTokenCount": output_tokens,
+                "cacheReadInputTokenCount": cache_read, "cacheWriteInputTokenCount": cache_write,
+            }})
+
+        return {"body": events()}
+
+
+class FakeS3Client:
+    """S3 client reading and writing objects under a local directory."""
+    def __init__(self, root: str = None, faults: FaultInjector = None):
+
+        self.root = root or os.getenv("OFFLINE_S3_ROOT", REPO_ROOT)
+        self.faults = faults or FaultInjector()
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get_object(self, Bucket=None, Key=None, **kwargs):
+        self.faults("s3", lambda: _throttling_error("GetObject"))
+        with open(self._path(Key), "rb") as f:
+            return {"Body": io.BytesIO(f.read())}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self.faults("s3", lambda: _throttling_error("PutObject"))
+        if os.path.abspath(Filename) != os.path.abspath(self._path(Key)):
+            os.makedirs(os.path.dirname(self._path(Key)), exist_ok=True)
+            with open(Filename, "rb") as src, open(self._path(Key), "wb") as dst:
+                dst.write(src.read())
+
+
+class _Indices:
+    def __init__(self, client):
+        self.client = client
+
+    def exists(self, index=None, **kwargs):
+        return index in self.client.indices_store
+
+    def create(self, index=None, body=None, **kwargs):
+        return self.client.create_index(index, body or {})
+
+    def refresh(self, index=None, **kwargs):
+        return {"_shards": {"failed": 0}}
+
+
+class FakeOpenSearch:
+    """In-memory OpenSearch: the index / _bulk / _search / _msearch / _count / _delete_by_query subset."""
+    def __init__(self, faults: FaultInjector = None):
+
+        self.faults = faults or FaultInjector()
+        self.indices_store = {}  # index name -> NumpyBackend
+        self.indices = _Indices(self)
+        self.transport = SimpleNamespace(serializer=SimpleNamespace(
+            dumps=lambda data: data if isinstance(data, str) else json.dumps(data)
+        ))
+        self._lock = threading.Lock()
+
+    def _check(self):
+        self.faults("search", self._too_many_requests)
+
+    @staticmethod
+    def _too_many_requests():
+        from opensearchpy.exceptions import TransportError
+        return TransportError(429, "too_many_requests", "offline fault injection")
+
+    def create_index(self, index, body):
+        from vector_backends import NumpyBackend
+
+        dimension = (
+            body.get("mappings", {}).get("properties", {}).get("embedding", {})
+            .get("dimension", DEFAULT_EMBEDDING_DIMENSION)
+        )
+        with self._lock:
+            if index not in self.indices_store:
+                self.indices_store[index] = NumpyBackend(path=None, dimension=dimension)
+                self._seed(self.indices_store[index], dimension)
+        return {"acknowledged": True, "index": index}
+
+    @staticmethod
+    def _seed(store, dimension):
+        """Load the knowledge base CSV so retrieval has something to find."""
+        seed_path = os.getenv("OFFLINE_SEED_CSV", os.path.join(REPO_ROOT, "data", "medical_data.csv"))
+        if not seed_path or not os.path.exists(seed_path):
+            return
+
+        from medical_data_store import MedicalDataStore
+
+        docs, ids = [], []
+        with open(seed_path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                text = row.get("combined_text") or ""
+                if not text.strip():
+                    continue
+                docs.append({
+                    "disease": row.get("disease"),
+                    "combined_text": text,
+                    "embedding": fake_embedding(text, dimension),
+                    "metadata": {"source": "original_data"},
+                })
+                ids.append(MedicalDataStore.document_id(row.get("disease"), text))
+        store.add_documents(docs, ids=ids)
+
+    def _store(self, index):
+        if index not in self.indices_store:
+            self.create_index(index, {})
+        return self.indices_store[index]
+
+    def _search(self, index, body):
+        store = self._store(index)
+        size = body.get("size", 10)
+        query = body.get("query", {})
+        include_vectors = "embedding" not in body.get("_source", {}).get("excludes", [])
+
+        if "knn" in query:
+            knn = query["knn"]["embedding"]
+            response = store.knn_search(knn["vector"], k=size, include_vectors=include_vectors)
+        elif "match" in query:
+            response = store.lexical_search(query["match"]["combined_text"], k=size)
+        else:
+            response = {"hits": {"total": {"value": store.count()}, "hits": []}}
+        return dict(response, took=0, timed_out=False)
+
+    # -------------------- CLIENT API --------------------
+    def search(self, index=None, body=None, **kwargs):
+        self._check()
+        return self._search(index, body or {})
+
+    def msearch(self, body=None, index=None, **kwargs):
+        self._check()
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()] if isinstance(body, str) else body
+        return {"responses": [
+            self._search(header.get("index", index), query) for header, query in zip(lines[0::2], lines[1::2])
+        ]}
+
+    def bulk(self, body=None, index=None, **kwargs):
+        self._check()
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+
+        items = []
+        position = 0
+        while position < len(lines):
+            op_type, meta = next(iter(lines[position].items()))
+            position += 1
+            store = self._store(meta.get("_index", index))
+            doc_id = meta.get("_id")
+
+            if op_type == "delete":
+                deleted = store.delete_documents([doc_id])
+                items.append({"delete": {"_id": doc_id, "status": 200 if deleted else 404,
+                                         "result": "deleted" if deleted else "not_found"}})
+                continue
+
+            source = lines[position]
+            position += 1
+            if doc_id is None:
+                doc_id = hashlib.sha256(json.dumps(source, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+            store.add_documents([source], ids=[doc_id])
+            items.append({op_type: {"_id": doc_id, "status": 201, "result": "created"}})
+
+        errors = any(next(iter(item.values()))["status"] >= 300 for item in items)
+        return {"took": 0, "errors": errors, "items": items}
+
+    def count(self, index=None, body=None, **kwargs):
+        if body and "term" in body.get("query", {}):
+            return {"count": self._store(index).count_by_source(body["query"]["term"]["metadata.source"])}
+        return {"count": self._store(index).count()}
+
+    def delete_by_query(self, index=None, body=None, **kwargs):
+        self._check()
+        source = body["query"]["term"]["metadata.source"]
+        return {"deleted": self._store(index).delete_by_source(source)}
+
+
+if __name__ == "__main__":
+
+    bedrock = FakeBedrockRuntime()
+
+    def embed(text):
+        response = bedrock.invoke_model(modelId="amazon.titan-embed-text-v2:0", body=json.dumps({"inputText": text}))
+        return json.loads(response["body"].read())["embedding"]
+
+    a, b, c = embed("throbbing headache and nausea"), embed("headache with nausea"), embed("itchy skin rash")
+    print(f"similar texts: {sum(x * y for x, y in zip(a, b)):.3f}, unrelated: {sum(x * y for x, y in zip(a, c)):.3f}")
+
+    response = bedrock.invoke_model(modelId="anthropic", body=json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "messages": [{"role": "user", "content": "I have a headache"}],
+    }))
+    print(json.loads(response["body"].read())["content"][0]["text"])
@@ -0,0 +1,118 @@
+"""
+Compact, token-counted prompt sections for the final report.
+
+The transcript is rendered as plain "Patient: / Assistant:" lines instead of the repr of the
+full_chat list of dicts, whitespace is collapsed, the STOP exchange is dropped, question-answer
+exchanges whose patient answers the clinical summary already covers are left out, and what
+remains is cut from the oldest end to a token budget.
+"""
+
+import re
+
+from lexical_search import tokenize
+from token_budget import estimate_tokens
+
+STOP_WORDS = {"stop", "end", "finish"}
+
+# words carrying no clinical content, ignored when checking summary coverage; negations and
+# yes / no answers are deliberately absent ("no fever" must not match a summary saying "fever")
+FILLER_WORDS = {
+    "a", "an", "the", "i", "im", "am", "is", "are", "was", "it", "its", "my", "me", "and", "or", "of",
+    "to", "in", "on", "at", "for", "with", "have", "has", "had", "been", "be", "do", "does", "did",
+    "so", "that", "this", "there", "some", "very", "really", "just", "also",
+    "hi", "hello", "ok", "okay", "thanks", "thank", "you", "about",
+}
+
+
+def compact_text(text) -> str:
+    """Collapse whitespace runs (including backslash line continuations) to single spaces."""
+    return re.sub(r"\s+", " ", str(text).replace("\\\n", " ")).strip()
+
+
+def transcript_turns(full_chat):
+    """[(speaker, text)] from a full_chat list of {"HumanMessage"/"AIMessage": text}, without STOP."""
+    turns = []
+    for messages_dict in full_chat or []:
+        if "HumanMessage" in messages_dict:
+            text = compact_text(messages_dict["HumanMessage"])
+            if text.lower() in STOP_WORDS:
+                continue
+            turns.append(("Patient", text))
+        elif "AIMessage" in messages_dict:
+            text = compact_text(messages_dict["AIMessage"])
+            if text.upper() == "STOP":
+                continue
+            turns.append(("Assistant", text))
+    return turns
+
+
+def is_covered(text: str, summary_terms: set, threshold: float = 0.8) -> bool:
+    """Whether at least `threshold` of the turn's content words appear in the summary."""
+    terms = [term for term in tokenize(text) if term not in FILLER_WORDS]
+    if not terms:
+        return False  # nothing to match, so nothing proves the summary has it
+    return sum(term in summary_terms for term in terms) / len(terms) >= threshold
+
+
+def drop_covered_turns(turns, summary: str, threshold: float = 0.8):
+    """
+    Drop question-answer exchanges whose patient answers the summary all covers.
+
+    An exchange is an assistant turn and the patient turns that follow it, kept or dropped
+    together so an answer never loses its question; an assistant turn nobody answered is kept.
+    """
+    summary_terms = set(tokenize(summary))
+
+    exchanges = []
+    for speaker, text in turns:
+        if speaker == "Assistant" or not exchanges:
+            exchanges.append([])
+        exchanges[-1].append((speaker, text))
+
+    kept = []
+    for exchange in exchanges:
+        answers = [text for speaker, text in exchange if speaker == "Patient"]
+        if answers and all(is_covered(text, summary_terms, threshold) for text in answers):
+            continue
+        kept.extend(exchange)
+    return kept
+
+
+def fit_turns_to_budget(turns, max_tokens: int):
+    """Keep the most recent turns that fit in max_tokens, noting how many were omitted."""
+    kept, used = [], 0
+    for speaker, text in reversed(turns):
+        tokens = estimate_tokens(f"{speaker}: {text}\n")
+        if used + tokens > max_tokens:
+            break
+        kept.append((speaker, text))
+        used += tokens
+
+    kept.reverse()
+    omitted = len(turns) - len(kept)
+    lines = [f"[{omitted} earlier turns omitted]"] if omitted else []
+    return lines + [f"{speaker}: {text}" for speaker, text in kept]
+
+
+def compact_transcript(full_chat, summary: str = None, max_tokens: int = None,
+                       drop_covered: bool = True, coverage_threshold: float = 0.8) -> str:
+    """Transcript lines for the prompt, optionally without turns the summary covers, within max_tokens."""
+    turns = transcript_turns(full_chat)
+    if summary and drop_covered:
+        turns = drop_covered_turns(turns, summary, coverage_threshold)
+
+    if max_tokens is None:
+        return "\n".join(f"{speaker}: {text}" for speaker, text in turns)
+    return "\n".join(fit_turns_to_budget(turns, max_tokens))
+
+
+def assemble_sections(sections):
+    """Join {TITLE: text} into one prompt body; returns (text, {TITLE: estimated tokens})."""
+    parts, token_counts = [], {}
+    for title, text in sections.items():
+        if not text:
+            continue
+        part = f"{title}:\n{text}"
+        parts.append(part)
+        token_counts[title] = estimate_tokens(part)
+    return "\n\n".join(parts), token_counts
@@ -0,0 +1,53 @@
+import threading
+
+# Bedrock prompt-cache checkpoint: everything up to and including the marked content block is
+# cached for ~5 minutes (refreshed on every hit) and billed / prefilled at a fraction of the cost
+CACHE_CHECKPOINT = {"type": "ephemeral"}
+
+
+def cacheable_blocks(*texts):
+    """Content blocks for texts sent in order, with a cache checkpoint after the first (stable) one."""
+    blocks = [{"type": "text", "text": text} for text in texts if text]
+    if blocks:
+        blocks[0]["cache_control"] = dict(CACHE_CHECKPOINT)
+    return blocks
+
+
+def cache_usage_of(message):
+    """(uncached input, cache read, cache write, output) tokens of a response or final stream chunk."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    details = usage.get("input_token_details") or {}
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "cache_read_tokens": details.get("cache_read", 0) or 0,
+        "cache_write_tokens": details.get("cache_creation", 0) or 0,
+        "output_tokens": usage.get("output_tokens", 0),
+    }
+
+
+class PromptCacheUsage:
+    """Process-wide per-agent totals of uncached input, cache-read, cache-write and output tokens."""
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self.agent_stats = {}  # agent name -> token totals and call count
+
+    def record(self, agent: str, usage: dict):
+        with self._lock:
+            stats = self.agent_stats.setdefault(agent, {
+                "calls": 0, "input_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0, "output_tokens": 0,
+            })
+            stats["calls"] += 1
+            for name, value in usage.items():
+                stats[name] += value
+
+    def stats(self):
+        """Totals per agent, with the share of prompt tokens served from the cache."""
+        with self._lock:
+            result = {}
+            for agent, stats in self.agent_stats.items():
+                prompt_tokens = stats["input_tokens"] + stats["cache_read_tokens"] + stats["cache_write_tokens"]
+                result[agent] = dict(stats, cache_hit_ratio=stats["cache_read_tokens"] / prompt_tokens if prompt_tokens else 0.0)
+            return result
@@ -0,0 +1,14 @@
+import os
+from functools import lru_cache
+
+import yaml
+
+# prompts.yaml ships next to the agents (/app/scripts in the container)
+PROMPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.yaml")
+
+
+@lru_cache(maxsize=None)
+def load_prompts(prompts_path: str = None):
+    """Parsed prompts.yaml, read once per process and shared by every agent (do not mutate)."""
+    with open(prompts_path or os.getenv("PROMPTS_PATH", PROMPTS_PATH), 'r') as f:
+        return yaml.safe_load(f)
@@ -1,7 +1,12 @@
-from langchain_core.messages import HumanMessage, SystemMessage
-import yaml
+import os
+import re
+from langchain_core.messages import HumanMessage
 
 from bedrock_initializer import BedrockModel
+from prompt_loader import load_prompts
+from prompt_assembly import assemble_sections, compact_text, compact_transcript
+from telemetry import traced
+from token_budget import estimate_tokens
 
 class ReportGeneratorAgent(BedrockModel):
 
@@ -10,44 +15,176 @@ class ReportGeneratorAgent(BedrockModel):
         # accessing bedrock model from it self.llm_chat
         super().__init__(**kwargs) 
 
-        # Load prompts
-        # prompts_path = "prompts.yaml"
-        prompts_path = "/app/scripts/prompts.yaml"
-        with open(prompts_path, 'r') as f:
-            prompts = yaml.safe_load(f)
+        # Load prompts (parsed once per process)
+        prompts = load_prompts()
 
         self.report_generator_prompt = prompts['medical_assistant']['report_generator_prompt']
+        self.summary_report_prompt = prompts['medical_assistant']['summary_report_prompt']
 
-    def generate_final_medical_report(self, full_chat, chat_summary, retrieved_knowledge=None):
+        # transcript budget and whether turns already captured by the clinical summary are left out
+        self.transcript_max_tokens = int(os.getenv("REPORT_TRANSCRIPT_MAX_TOKENS", 1500))
+        self.drop_covered_turns = os.getenv("REPORT_DROP_COVERED_TURNS", "true").lower() == "true"
+        self.coverage_threshold = float(os.getenv("REPORT_COVERAGE_THRESHOLD", 0.8))
+
+        # the single-pass summary + report answer is longer than a report alone
+        self.summary_report_max_tokens = int(os.getenv("SUMMARY_REPORT_MAX_TOKENS", 2048))
+
+    def assemble_report_prompt(self, full_chat, chat_summary, retrieved_knowledge=None):
+        """Report messages plus the estimated token count of every prompt section."""
 
-        print("____________________________________\n")
-        print("=== Generating Final Report ===")
         # severity_flag = self.calculate_severity_flag(chat_summary, full_chat)
         severity_flag = None
-        
-        enhanced_prompt = f"""
-        {self.report_generator_prompt}
-        
-        ADDITIONAL CONTEXT:
-        - Calculated Severity Flag: {severity_flag}
-        """
+
+        system_prompt = self.report_generator_prompt.strip()
+        if severity_flag is not None:
+            system_prompt += f"\n\nADDITIONAL CONTEXT:\n- Calculated Severity Flag: {severity_flag}"
 
         # - Current Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M')}
+
+        body, token_counts = assemble_sections({
+            "CLINICAL SUMMARY": compact_text(chat_summary),
+            "RETRIEVED MEDICAL KNOWLEDGE": compact_text(retrieved_knowledge) if retrieved_knowledge else None,
+            "FULL CONVERSATION": compact_transcript(
+                full_chat,
+                summary=chat_summary,
+                max_tokens=self.transcript_max_tokens,
+                drop_covered=self.drop_covered_turns,
+                coverage_threshold=self.coverage_threshold,
+            ),
+        })
+        token_counts = dict({"SYSTEM PROMPT": estimate_tokens(system_prompt)}, **token_counts)
+
+        messages = [
+            self.system_message(system_prompt),
+            HumanMessage(content=body)
+        ]
+        return messages, token_counts
+
+    def build_report_messages(self, full_chat, chat_summary, retrieved_knowledge=None):
+
+        messages, token_counts = self.assemble_report_prompt(full_chat, chat_summary, retrieved_knowledge)
+        print(f"=== Report prompt: ~{sum(token_counts.values())} tokens {token_counts} ===")
+        return messages
+
+    # -------------------- SINGLE PASS: CLINICAL SUMMARY + REPORT --------------------
+    def assemble_summary_report_prompt(self, full_chat, retrieved_knowledge=None):
+        """Messages asking for the clinical summary and the report in one tagged answer, plus section token counts."""
+        system_prompt = self.report_generator_prompt.strip() + "\n\n" + self.summary_report_prompt.strip()
+
+        # without a summary nothing can be dropped as covered; the transcript is only cut to budget
+        body, token_counts = assemble_sections({
+            "RETRIEVED MEDICAL KNOWLEDGE": compact_text(retrieved_knowledge) if retrieved_knowledge else None,
+            "FULL CONVERSATION": compact_transcript(full_chat, max_tokens=self.transcript_max_tokens),
+        })
+        token_counts = dict({"SYSTEM PROMPT": estimate_tokens(system_prompt)}, **token_counts)
+
+        messages = [
+            self.system_message(system_prompt),
+            HumanMessage(content=body)
+        ]
+        return messages, token_counts
+
+    @staticmethod
+    def parse_summary_and_report(text):
+        """
+        (clinical summary, report) from a tagged single-pass answer.
+
+        The summary is None when the answer does not follow the format; the whole answer is then
+        taken as the report.
+        """
+        summary = re.search(r"<clinical_summary>(.*?)</clinical_summary>", text, flags=re.DOTALL)
+        report = re.search(r"<medical_report>(.*?)(?:</medical_report>|$)", text, flags=re.DOTALL)
+        if summary is None:
+            return None, text.strip()
+        if report is None:
+            return summary.group(1).strip(), text[summary.end():].strip()
+        return summary.group(1).strip(), report.group(1).strip()
+
+    @traced("summary_and_report")
+    def generate_summary_and_report(self, full_chat, retrieved_knowledge=None):
+        """Clinical summary and final report from a single LLM call; returns (summary or None, report)."""
+        print("____________________________________\n")
+        print("=== Generating Clinical Summary + Final Report (single pass) ===")
+
+        messages, token_counts = self.assemble_summary_report_prompt(full_chat, retrieved_knowledge)
+        print(f"=== Summary + report prompt: ~{sum(token_counts.values())} tokens {token_counts} ===")
+
+        answer = self.invoke_llm(messages, call_type="summary_and_report", max_tokens=self.summary_report_max_tokens)
+
+        print("=== Clinical Summary + Final Report Generated ===")
+        return self.parse_summary_and_report(answer.content)
+
+    @traced("summary_and_report", streaming=True)
+    def generate_summary_and_report_stream(self, full_chat, retrieved_knowledge=None, result: dict = None):
+        """
+        Streaming variant of generate_summary_and_report(): yields only the report text.
+
+        The summary section is buffered; once the stream is exhausted result (if given) holds
+        "clinical_summary" (None when the answer was not tagged) and "medical_report".
+        """
+        print("____________________________________\n")
+        print("=== Generating Clinical Summary + Final Report (single pass, streaming) ===")
+
+        messages, token_counts = self.assemble_summary_report_prompt(full_chat, retrieved_knowledge)
+        print(f"=== Summary + report prompt: ~{sum(token_counts.values())} tokens {token_counts} ===")
+
+        open_tag, close_tag = "<medical_report>", "</medical_report>"
+        answer, emitted = "", 0  # emitted: characters of answer already yielded
+        for text in self.stream_llm(messages, call_type="summary_and_report", max_tokens=self.summary_report_max_tokens):
+            answer += text
+            start = answer.find(open_tag)
+            if start < 0:
+                continue
+            start += len(open_tag)
+
+            # hold back a possible partial closing tag at the end of the buffer
+            end = answer.find(close_tag, start)
+            end = end if end >= 0 else max(start, len(answer) - len(close_tag))
+            piece = answer[max(emitted, start):end]
+            if emitted <= start:
+                piece = piece.lstrip()
+            if piece:
+                yield piece
+                emitted = end
+
+        start = answer.find(open_tag)
+        if start >= 0 and answer.find(close_tag, start) < 0:
+            # stopped before the closing tag (e.g. max_tokens): release the held-back tail
+            tail = answer[max(emitted, start + len(open_tag)):]
+            tail = tail.lstrip() if emitted <= start + len(open_tag) else tail
+            if tail.rstrip():
+                yield tail.rstrip()
+
+        summary, report = self.parse_summary_and_report(answer)
+        if start < 0:
+            yield report  # untagged answer: nothing was streamed yet
+        if result is not None:
+            result.update(clinical_summary=summary, medical_report=report)
+
+        print("=== Clinical Summary + Final Report Generated ===")
+
+    @traced("report")
+    def generate_final_medical_report(self, full_chat, chat_summary, retrieved_knowledge=None):
+
+        print("____________________________________\n")
+        print("=== Generating Final Report ===")
         
-        report = self.llm_chat.invoke([
-            SystemMessage(content=enhanced_prompt),
-            HumanMessage(content=f"""
-            CLINICAL SUMMARY: {chat_summary}
-            
-            RETRIEVED MEDICAL KNOWLEDGE: {retrieved_knowledge}
-            
-            FULL CONVERSATION: {full_chat}
-            """)
-        ])
+        report = self.invoke_llm(self.build_report_messages(full_chat, chat_summary, retrieved_knowledge), call_type="report")
         
         print("=== Final Report Generated ===")
 
         return report.content
+
+    @traced("report", streaming=True)
+    def generate_final_medical_report_stream(self, full_chat, chat_summary, retrieved_knowledge=None):
+
+        """Streaming variant of generate_final_medical_report(): yields report text chunks."""
+        print("____________________________________\n")
+        print("=== Generating Final Report (streaming) ===")
+
+        yield from self.stream_llm(self.build_report_messages(full_chat, chat_summary, retrieved_knowledge), call_type="report")
+
+        print("=== Final Report Generated ===")
     
 if __name__=="__main__":
     pass
@@ -1,9 +1,8 @@
 import os
-import boto3
 from dotenv import load_dotenv
-from opensearchpy import OpenSearch
 
 from medical_data_store import MedicalDataStore
+from telemetry import span, traced
 
 class MedicalDataRetrieval:
     
@@ -11,29 +10,23 @@ class MedicalDataRetrieval:
 
         self.med_data = MedicalDataStore()
         
-        """Initialize embedding + OpenSearch connection."""
+        """Reuse the data store's embedding client and vector backend."""
         load_dotenv(dotenv_path="/app/.env")
 
-        self.bedrock = boto3.client("bedrock-runtime")  # IAM must allow bedrock:InvokeModel
-        self.index_name = "medical-embeddings"
+        self.index_name = self.med_data.index_name
+        self.vector_store = self.med_data.vector_store
 
         # AWS setup
         self.region = os.getenv("AWS_REGION")
-        self.host = os.getenv("AWS_OPENSEARCH_HOST")
         self.embedding_model = os.getenv("AWS_TITAN_EMBEDDING_MODEL")
-        self.username = os.getenv("AWS_OPENSEARCH_USERNAME")
-        self.password = os.getenv("AWS_OPENSEARCH_PASSWORD")
-
-        self.opensearch = OpenSearch(
-            hosts=[{"host": self.host, "port": 443}],
-            http_auth=(self.username, self.password),
-            use_ssl=True,
-            verify_certs=True
-            )
 
         self.retrieve_threshold = 0.5
+
+        # 'knn' (vector only) or 'hybrid' (BM25 on combined_text + k-NN, reciprocal rank fusion)
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "knn").lower()
     
-    def retrieve_data(self, query: str, k: int = 1):
+    @traced("retrieval")
+    def retrieve_data(self, query: str, k: int = 1, mode: str = None):
 
         """
         Retrieve the top-k most relevant chunks for a query.
@@ -43,19 +36,12 @@ class MedicalDataRetrieval:
 
         query_emb = self.med_data.get_embedding(query)
 
-        query = {
-            "size": k,
-            "query": {
-                "knn": {
-                    "embedding": {
-                        "vector": query_emb,
-                        "k": k
-                    }
-                }
-            }
-        }
-
-        response = self.opensearch.search(index=self.index_name, body=query)
+        mode = mode or self.retrieval_mode
+        with span("search", mode=mode, k=k):
+            if mode == "hybrid":
+                response = self.vector_store.hybrid_search(query, query_emb, k=k)
+            else:
+                response = self.vector_store.knn_search(query_emb, k=k)
 
         # print(f"🧠 Disease: {results["hits"]["hits"][0]["_score"]}")
         # print(f"🧠 Disease: {results["hits"]["hits"][0]["_source"]["disease"]}")
@@ -69,6 +55,58 @@ class MedicalDataRetrieval:
             result = response["hits"]["hits"][0]["_source"]["combined_text"]
 
         return result
+
+    @traced("retrieval")
+    def retrieve_many(self, queries, k: int = 1, mode: str = None, max_workers: int = None):
+
+        """
+        Retrieve the top-k chunks for several queries at once.
+
+        Queries are embedded concurrently and every search goes out in a single _msearch
+        request. Returns one list of {id, disease, combined_text, source, score} per query.
+        """
+        if not queries:
+            return []
+
+        print("____________________________________\n")
+        print(f"=== Retrieving Medical Data for {len(queries)} queries ===")
+
+        query_embs = self.med_data.get_embeddings(queries, max_workers=max_workers)
+
+        mode = mode or self.retrieval_mode
+        with span("search", mode=mode, k=k, queries=len(queries)):
+            if mode == "hybrid":
+                responses = self.vector_store.hybrid_search_many(queries, query_embs, k=k)
+            else:
+                responses = self.vector_store.knn_search_many(query_embs, k=k)
+
+        results = []
+        for response in responses:
+            results.append([
+                {
+                    "id": hit.get("_id"),
+                    "disease": hit["_source"].get("disease"),
+                    "combined_text": hit["_source"].get("combined_text"),
+                    "source": hit["_source"].get("metadata", {}).get("source"),
+                    "score": hit.get("_score"),
+                }
+                for hit in response["hits"]["hits"]
+            ])
+        return results
+
+    def retrieve_candidates(self, query: str, k: int = 5):
+
+        """
+        Retrieve the top-k hits for a query together with their stored embeddings.
+
+        Returns (query embedding, hits).
+        """
+        query_emb = self.med_data.get_embedding(query)
+
+        with span("search", mode="knn", k=k, include_vectors=True):
+            response = self.vector_store.knn_search(query_emb, k=k, include_vectors=True)
+
+        return query_emb, response["hits"]["hits"]
     
 if __name__ == "__main__":
 
@@ -1,9 +1,9 @@
-import boto3
 from dotenv import load_dotenv
 import os
-import pandas as pd
 from io import StringIO
 
+from client_registry import get_s3_client
+
 class S3DataBucket:
 
     def __init__(self):
@@ -18,10 +18,7 @@ class S3DataBucket:
         # self.file_path = "../data/medical_data.csv"
         self.s3_key = "data/medical_data.csv"
 
-        self.s3_client = boto3.client(
-            service_name='s3',
-            region_name=region_name
-            )
+        self.s3_client = get_s3_client(region_name)
 
     def s3_data_upload(self):
 
@@ -35,7 +32,8 @@ class S3DataBucket:
         response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_key)
         csv_content = response['Body'].read().decode('utf-8')
 
-        # Load into pandas
+        # Load into pandas (imported here, only ingestion needs it)
+        import pandas as pd
         df = pd.read_csv(StringIO(csv_content))
         print(" === Fetched data from S3 Bucket === \n")
         print(" === Head of the dataframe === \n")
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+class SessionStore(MutableMapping):
+    """
+    Bounded per-session store used in place of a plain dict keyed by session_id.
+
+    Sessions idle for longer than idle_ttl_seconds, or beyond max_sessions (least recently used
+    first), are evicted from memory. With a SQLite path configured, evicted ChatMessageHistory and
+    JSON-serializable values are spilled to disk and transparently restored on next access.
+    """
+    def __init__(self,
+        namespace: str = "default",
+        max_sessions: int = None,
+        idle_ttl_seconds: float = None,
+        disk_path: str = None,
+        disk_ttl_seconds: float = None,
+        ):
+
+        self.namespace = namespace
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_STORE_MAX_SESSIONS", 1000))
+        self.idle_ttl_seconds = idle_ttl_seconds or float(os.getenv("SESSION_STORE_IDLE_TTL_SECONDS", 3600))
+        self.disk_ttl_seconds = disk_ttl_seconds or float(os.getenv("SESSION_STORE_DISK_TTL_SECONDS", 7 * 24 * 3600))
+        disk_path = disk_path if disk_path is not None else os.getenv("SESSION_STORE_PATH")
+
+        self._lock = threading.RLock()
+        self._sessions = OrderedDict()  # session_id -> [value, last_access, approx_bytes]
+
+        self.evicted = 0
+        self.spilled = 0
+        self.restored = 0
+
+        self._conn = None
+        if disk_path:
+            disk_dir = os.path.dirname(disk_path)
+            if disk_dir:
+                os.makedirs(disk_dir, exist_ok=True)
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    namespace TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (namespace, session_id)
+                )"""
+            )
+            self._conn.commit()
+
+    # -------------------- SIZE ACCOUNTING --------------------
+    @staticmethod
+    def estimate_bytes(value):
+        """Approximate memory held by a session value."""
+        if isinstance(value, ChatMessageHistory):
+            return sum(sys.getsizeof(message.content) for message in value.messages) + sys.getsizeof(value.messages)
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(SessionStore.estimate_bytes(item) for item in value)
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(SessionStore.estimate_bytes(item) for item in value.values())
+        return sys.getsizeof(value)
+
+    # -------------------- DISK SPILL --------------------
+    @staticmethod
+    def _serialize(value):
+        if isinstance(value, ChatMessageHistory):
+            return json.dumps({"type": "chat_history", "messages": messages_to_dict(value.messages)})
+        try:
+            return json.dumps({"type": "json", "value": value})
+        except TypeError:
+            return None  # futures, clients... live in memory only
+
+    @staticmethod
+    def _deserialize(payload):
+        data = json.loads(payload)
+        if data["type"] == "chat_history":
+            return ChatMessageHistory(messages=messages_from_dict(data["messages"]))
+        return data["value"]
+
+    def _spill(self, session_id, value, last_access):
+        if self._conn is None:
+            return
+        payload = self._serialize(value)
+        if payload is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (namespace, session_id, payload, last_access) VALUES (?, ?, ?, ?)",
+            (self.namespace, session_id, payload, last_access)
+        )
+        self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (time.time() - self.disk_ttl_seconds,))
+        self._conn.commit()
+        self.spilled += 1
+
+    def _restore(self, session_id):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT payload, last_access FROM sessions WHERE namespace = ? AND session_id = ?",
+            (self.namespace, session_id)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self._conn.execute(
+            "DELETE FROM sessions WHERE namespace = ? AND session_id = ?", (self.namespace, session_id)
+        )
+        self._conn.commit()
+        if time.time() - row[1] > self.disk_ttl_seconds:
+            return None
+
+        self.restored += 1
+        return self._deserialize(row[0])
+
+    # -------------------- EVICTION --------------------
+    def _evict(self):
+        now = time.time()
+
+        # entries are kept in access order, so idle ones sit at the front
+        while self._sessions:
+            session_id, (value, last_access, _) = next(iter(self._sessions.items()))
+            if now - last_access <= self.idle_ttl_seconds and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self._spill(session_id, value, last_access)
+            self.evicted += 1
+
+    def _touch(self, session_id, value):
+        self._sessions[session_id] = [value, time.time(), self.estimate_bytes(value)]
+        self._sessions.move_to_end(session_id)
+
+    # -------------------- MAPPING INTERFACE --------------------
+    def __getitem__(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                value = entry[0]
+            else:
+                value = self._restore(session_id)
+                if value is None:
+                    raise KeyError(session_id)
+            self._touch(session_id, value)
+            self._evict()
+            return value
+
+    def __setitem__(self, session_id, value):
+        with self._lock:
+            self._touch(session_id, value)
+            self._evict()
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+            if self._conn is not None:
+                cursor = self._conn.execute(
+                    "DELETE FROM sessions WHERE namespace = ? AND session_id = ?", (self.namespace, session_id)
+                )
+                self._conn.commit()
+                found = found or cursor.rowcount > 0
+            if not found:
+                raise KeyError(session_id)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                return True
+            if self._conn is None:
+                return False
+            row = self._conn.execute(
+                "SELECT last_access FROM sessions WHERE namespace = ? AND session_id = ?",
+                (self.namespace, session_id)
+            ).fetchone()
+            return row is not None and time.time() - row[0] <= self.disk_ttl_seconds
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        """Sessions in memory, their approximate footprint and eviction counters."""
+        with self._lock:
+            self._evict()
+            return {
+                "namespace": self.namespace,
+                "sessions": len(self._sessions),
+                "memory_bytes": sum(entry[2] for entry in self._sessions.values()),
+                "evicted": self.evicted,
+                "spilled": self.spilled,
+                "restored": self.restored,
+            }
@@ -0,0 +1,152 @@
+import os
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class SpeculativeRetrieval:
+    """
+    Runs retrieval on the raw patient turns while the final chat summary is being generated.
+
+    The speculative search fetches a few extra candidates with their embeddings. Once the summary
+    is ready it is embedded and the candidates are re-ranked locally. The speculative result is
+    reused only when it provably equals what a k-NN search on the summary would return, otherwise
+    retrieval falls back to the normal summary-based search.
+    """
+    def __init__(self, retrieval_agent, summary_agent, candidate_k: int = None, max_workers: int = 4):
+
+        self.retrieval_agent = retrieval_agent
+        self.summary_agent = summary_agent
+        self.candidate_k = candidate_k or int(os.getenv("SPECULATIVE_CANDIDATE_K", 10))
+
+        self.max_workers = max_workers
+        self.executor = None  # created on first speculative search
+        self._lock = threading.Lock()
+
+        self.reused = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def get_patient_text(full_chat):
+        """Concatenate the patient's turns, ignoring the STOP command."""
+        turns = [
+            messages_dict["HumanMessage"] for messages_dict in full_chat
+            if "HumanMessage" in messages_dict
+            and messages_dict["HumanMessage"].lower().strip() not in ["stop", "end", "finish"]
+        ]
+        return "\n".join(turns)
+
+    @staticmethod
+    def _unit(vector):
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    @staticmethod
+    def _distance(a, b):
+        return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+    def rerank_if_exact(self, query_emb, hits, summary_emb, k: int = 1):
+        """
+        Re-rank speculative hits against the summary embedding.
+
+        Every document outside the candidate set is at least r_m away from the speculative query p,
+        where r_m is the distance to the farthest candidate. By the triangle inequality it is then at
+        least r_m - |s - p| away from the summary s, so if the k-th closest candidate to s is within
+        that bound, the candidates' top-k is the exact top-k. Returns the re-ranked hits or None.
+        """
+        if len(hits) < k:
+            return None
+
+        p = self._unit(query_emb)
+        s = self._unit(summary_emb)
+        candidates = [(self._unit(hit["_source"]["embedding"]), hit) for hit in hits]
+
+        ranked = sorted(candidates, key=lambda c: self._distance(s, c[0]))
+
+        if len(hits) < self.candidate_k:
+            # the store holds fewer documents than requested, so every document was a candidate
+            return [hit for _, hit in ranked[:k]]
+
+        r_m = max(self._distance(p, emb) for emb, _ in candidates)
+        bound = r_m - self._distance(s, p)
+
+        if self._distance(s, ranked[k - 1][0]) <= bound:
+            return [hit for _, hit in ranked[:k]]
+        return None
+
+    def get_executor(self):
+        with self._lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="speculative-retrieval")
+            return self.executor
+
+    def retrieve_on_conversation(self, full_chat, candidates=None, checkpoint=None):
+        """
+        Retrieval for the single-pass report, which has no final summary to search on.
+
+        Searches the patient turns (through prefetched candidates when exact), or the latest
+        intermediate summary when there are none (e.g. a conversation that was only STOP).
+        Returns None when there is nothing to search on.
+        """
+        patient_text = self.get_patient_text(full_chat)
+        if patient_text.strip():
+            if candidates is not None:
+                return self.retrieve_from_candidates(patient_text, candidates)
+            return self.retrieval_agent.retrieve_data(patient_text)
+
+        summary = (checkpoint or {}).get("summary") or ""
+        if summary.strip():
+            return self.retrieval_agent.retrieve_data(summary)
+
+        print("=== No patient text to retrieve on, reporting without retrieved knowledge ===")
+        return None
+
+    def retrieve_from_candidates(self, chat_summary, candidates, k: int = 1):
+
+        """
+        Answer retrieval for the summary from a (query embedding, hits) candidate set, e.g. one
+        prefetched during the conversation. Falls back to a k-NN search on the summary when the
+        candidates cannot be proven to contain the exact top-k.
+        """
+        # the exactness bound only covers pure k-NN retrieval
+        if candidates is not None and self.retrieval_agent.retrieval_mode == "knn":
+            query_emb, hits = candidates
+            summary_emb = self.retrieval_agent.med_data.get_embedding(chat_summary)
+            top_hits = self.rerank_if_exact(query_emb, hits, summary_emb, k)
+
+            if top_hits is not None:
+                self.reused += 1
+                print("=== Speculative retrieval reused ===")
+                return top_hits[0]["_source"]["combined_text"]
+
+        self.fallbacks += 1
+        print("=== Speculative retrieval missed, retrieving on summary ===")
+        return self.retrieval_agent.retrieve_data(chat_summary, k=k)
+
+    def summarize_and_retrieve(self, full_chat, k: int = 1, candidates=None, checkpoint=None):
+
+        """
+        Generate the final chat summary and the retrieved knowledge for it.
+
+        candidates optionally provides an already-fetched (query embedding, hits) pair, such as
+        the conversation's prefetched set, in which case no speculative search is started.
+        Returns (chat summary, retrieved knowledge text).
+        """
+        future = None
+        if candidates is None:
+            patient_text = self.get_patient_text(full_chat)
+            if patient_text.strip():
+                future = self.get_executor().submit(self.retrieval_agent.retrieve_candidates, patient_text, self.candidate_k)
+
+        chat_summary = self.summary_agent.generate_chat_summary(full_chat, checkpoint=checkpoint)
+
+        if future is not None:
+            try:
+                candidates = future.result()
+            except Exception as e:
+                print(f"=== Speculative retrieval failed: {e} ===")
+                candidates = None
+
+        return chat_summary, self.retrieve_from_candidates(chat_summary, candidates, k)
+
+    def stats(self):
+        return {"reused": self.reused, "fallbacks": self.fallbacks}
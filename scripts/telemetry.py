@@ -0,0 +1,249 @@
+"""
+Lightweight tracing and per-stage latency metrics.
+
+    with span("search", mode="knn"):
+        ...
+
+    @traced("final_summary")
+    def generate_chat_summary(self, full_chat): ...
+
+Every finished span adds its duration to the histogram of its stage (p50 / p95 / p99 over the last
+TELEMETRY_MAX_SAMPLES durations, default 10000) and, when TELEMETRY_EXPORT_PATH is set, is appended
+to that file as one JSON line {trace_id, span_id, parent_id, name, start, duration_ms, error,
+attributes}. Spans nest through contextvars, so the LLM call and embedding lookups of a chat turn
+share the turn's trace id (work handed to a thread pool starts a new trace). A generator's span is
+current only while the generator runs (see traced_stream), never across a yield, so spans the
+consumer opens between chunks are not its children. snapshot() is served by the API's /metrics
+endpoint. TELEMETRY_ENABLED=false stops all recording.
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import inspect
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed stage; ended by leaving its with block or by end()."""
+    def __init__(self, name: str, telemetry, attributes: dict):
+
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+        self._telemetry = telemetry
+        self._token = None
+
+    def set(self, **attributes):
+        """Add attributes known only while the stage runs (hit counts, model, cache result...)."""
+        self.attributes.update(attributes)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def end(self, error: str = None, duration_ms: float = None):
+        """Record the span; duration_ms defaults to the time since it started."""
+        if self.duration_ms is not None:
+            return  # already ended
+        self.duration_ms = duration_ms if duration_ms is not None else self.elapsed_ms()
+        self.error = error
+        self._telemetry.record(self)
+
+    @contextmanager
+    def active(self):
+        """Make this span the parent of spans opened inside the block, without ending it."""
+        token = _current_span.set(self)
+        try:
+            yield self
+        finally:
+            _current_span.reset(token)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        self.end(f"{exc_type.__name__}: {exc}" if exc_type is not None else None)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Telemetry:
+    """Per-stage latency histograms and the optional JSONL span export, shared process-wide."""
+    def __init__(self, export_path: str = None, max_samples: int = None, enabled: bool = None):
+
+        if enabled is None:
+            enabled = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+        self.enabled = enabled
+        self.export_path = export_path if export_path is not None else os.getenv("TELEMETRY_EXPORT_PATH", "")
+        self.max_samples = max_samples or int(os.getenv("TELEMETRY_MAX_SAMPLES", 10000))
+
+        self._lock = threading.Lock()
+        self._stages = {}  # stage -> {"count", "errors", "total_ms", "samples": recent durations}
+        self._export_file = None  # opened on the first exported span
+
+    def record(self, span: Span):
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.get(span.name)
+            if stage is None:
+                stage = {"count": 0, "errors": 0, "total_ms": 0.0, "samples": deque(maxlen=self.max_samples)}
+                self._stages[span.name] = stage
+            stage["count"] += 1
+            stage["errors"] += span.error is not None
+            stage["total_ms"] += span.duration_ms
+            stage["samples"].append(span.duration_ms)
+
+            if self.export_path:
+                if self._export_file is None:
+                    export_dir = os.path.dirname(self.export_path)
+                    if export_dir:
+                        os.makedirs(export_dir, exist_ok=True)
+                    self._export_file = open(self.export_path, "a", encoding="utf-8", buffering=1)
+                self._export_file.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    @staticmethod
+    def percentile(sorted_values, q: float):
+        """Nearest-rank percentile of an ascending list."""
+        return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))]
+
+    def snapshot(self):
+        """{stage: count, errors, mean / p50 / p95 / p99 / max in ms} (percentiles over the recent samples)."""
+        with self._lock:
+            stages = {name: dict(stage, samples=sorted(stage["samples"])) for name, stage in self._stages.items()}
+
+        result = {}
+        for name, stage in sorted(stages.items()):
+            samples = stage["samples"]
+            result[name] = {
+                "count": stage["count"],
+                "errors": stage["errors"],
+                "mean_ms": stage["total_ms"] / stage["count"],
+                "p50_ms": self.percentile(samples, 0.50),
+                "p95_ms": self.percentile(samples, 0.95),
+                "p99_ms": self.percentile(samples, 0.99),
+                "max_ms": samples[-1],
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def print_summary(self):
+        print("=== Stage latency (ms) ===")
+        for name, stats in self.snapshot().items():
+            print(
+                f"{name:22s} n {stats['count']:6d}  p50 {stats['p50_ms']:9.1f}  p95 {stats['p95_ms']:9.1f}  "
+                f"p99 {stats['p99_ms']:9.1f}  max {stats['max_ms']:9.1f}  errors {stats['errors']}"
+            )
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """The process-wide Telemetry instance."""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry()
+    return _telemetry
+
+
+def span(name: str, **attributes):
+    """Span for a with block; nested spans become its children."""
+    return Span(name, get_telemetry(), attributes)
+
+
+def start_span(name: str, **attributes):
+    """Span ended explicitly with end(), for stages that do not fit a with block."""
+    return Span(name, get_telemetry(), attributes)
+
+
+def current_span():
+    """The innermost current span, or None."""
+    return _current_span.get()
+
+
+def traced_stream(name: str, generator, **attributes):
+    """
+    Iterate a generator in a span that is current only while the generator runs.
+
+    The span is made current around each next() rather than across yields. Its duration is the
+    time spent producing items, not the consumer's time between them (wall_ms has both). The span
+    ends when the generator is exhausted, fails or is closed early.
+    """
+    stage = start_span(name, **attributes)
+    producing_s, error = 0.0, None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                with stage.active():
+                    item = next(generator)
+            except StopIteration:
+                return
+            finally:
+                producing_s += time.perf_counter() - start
+            yield item
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        generator.close()
+        stage.set(wall_ms=round(stage.elapsed_ms(), 3))
+        stage.end(error, duration_ms=producing_s * 1000)
+
+
+def traced(name: str, **attributes):
+    """Decorator running each call of a function in a span (through traced_stream for generators)."""
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def stream_wrapper(*args, **kwargs):
+                return traced_stream(name, fn(*args, **kwargs), **attributes)
+            return stream_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    return get_telemetry().snapshot()
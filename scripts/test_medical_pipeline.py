@@ -1,22 +1,39 @@
+import os
+import sys
 import uuid
 import json
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from conversation_agent import ConversationAgent
 from chat_summary_agent import ChatSummaryAgent
 from report_generator_agent import ReportGeneratorAgent
 from retrieval_agent import MedicalDataRetrieval
 from doctor_validation import SummarizeValidatedReport
+from speculative_retrieval import SpeculativeRetrieval
+from session_store import SessionStore
+from telemetry import get_telemetry, traced
 
 class MedicalPipeline:
 
     def __init__(self):
         
-        self.conversation_agent = ConversationAgent()
-        self.chat_summary = ChatSummaryAgent()
         self.retrieval_data = MedicalDataRetrieval()
+        self.conversation_agent = ConversationAgent(retrieval_agent=self.retrieval_data)
+        self.chat_summary = ChatSummaryAgent()
         self.report_generator = ReportGeneratorAgent()
         self.doc_validated_report = SummarizeValidatedReport()
 
-        self.session_results = {}  # Store results by session_id
+        # retrieval on the patient turns overlapped with the final summary call
+        self.use_speculative_retrieval = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+        self.speculative_retrieval = SpeculativeRetrieval(self.retrieval_data, self.chat_summary)
+
+        # "two_call": summary, retrieval on the summary, report; "fused": retrieval on the
+        # conversation, then the summary and the report from a single LLM call
+        self.report_mode = os.getenv("REPORT_MODE", "two_call")
+
+        self.session_results = SessionStore(namespace="pipeline_results")  # Store results by session_id
     
     def run_pipeline(self, user_symptoms=None, session_id=None):
 
@@ -50,26 +67,7 @@ class MedicalPipeline:
         # Generate final report
         if full_chat:
 
-            print("\nGenerating final chat summary...")
-            final_summary = self.chat_summary.generate_chat_summary(full_chat)
-
-            print("\nRetrieving medical data...")
-            retrieved_data = self.retrieval_data.retrieve_data(final_summary)
-
-            print("\nGenerating medical report...")
-            medical_report = self.report_generator.generate_final_medical_report(
-                full_chat=full_chat,
-                chat_summary=final_summary,
-                retrieved_knowledge=retrieved_data  # Skip for now
-            )
-            
-            # Store results
-            result = {
-                "session_id": session_id,
-                "full_chat": full_chat,
-                "clinical_summary": final_summary,
-                "medical_report": medical_report
-            }
+            medical_report, result = self.generate_report(session_id, full_chat)
             
             print("\n" + "=" * 60)
             print("MEDICAL ASSESSMENT REPORT")
@@ -90,6 +88,184 @@ class MedicalPipeline:
             print("No final summary generated.")
             return None, None
     
+    @traced("post_conversation")
+    def generate_report(self, session_id, full_chat, mode=None):
+        """Chat summary, retrieval and medical report for a finished conversation."""
+        mode = mode or self.report_mode
+        if mode not in ("two_call", "fused"):
+            raise ValueError(f"Unknown report mode: {mode}")
+        timings = {}  # stage -> seconds
+
+        start = time.perf_counter()
+        prefetched = self.conversation_agent.pop_prefetched_candidates(session_id)
+        checkpoint = self.conversation_agent.get_summary_checkpoint(session_id)  # latest intermediate summary
+
+        if mode == "fused":
+            print("\nRetrieving medical data on the conversation...")
+            retrieved_data = self.speculative_retrieval.retrieve_on_conversation(full_chat, prefetched, checkpoint)
+            timings["retrieval"] = time.perf_counter() - start
+
+            print("\nGenerating clinical summary and medical report...")
+            start = time.perf_counter()
+            final_summary, medical_report = self.report_generator.generate_summary_and_report(full_chat, retrieved_data)
+            timings["summary_and_report"] = time.perf_counter() - start
+
+            if final_summary is None:
+                print("=== Single-pass answer had no summary section, generating it separately ===")
+                start = time.perf_counter()
+                final_summary = self.chat_summary.generate_chat_summary(full_chat, checkpoint=checkpoint)
+                timings["summary"] = time.perf_counter() - start
+
+            return medical_report, self.store_result(session_id, full_chat, final_summary, retrieved_data, medical_report, timings)
+
+        if self.use_speculative_retrieval:
+            print("\nGenerating final chat summary with speculative retrieval...")
+            final_summary, retrieved_data = self.speculative_retrieval.summarize_and_retrieve(
+                full_chat, candidates=prefetched, checkpoint=checkpoint
+            )
+            timings["summary_and_retrieval"] = time.perf_counter() - start
+        else:
+            print("\nGenerating final chat summary...")
+            final_summary = self.chat_summary.generate_chat_summary(full_chat, checkpoint=checkpoint)
+            timings["summary"] = time.perf_counter() - start
+
+            print("\nRetrieving medical data...")
+            start = time.perf_counter()
+            if prefetched is not None:
+                retrieved_data = self.speculative_retrieval.retrieve_from_candidates(final_summary, prefetched)
+            else:
+                retrieved_data = self.retrieval_data.retrieve_data(final_summary)
+            timings["retrieval"] = time.perf_counter() - start
+
+        print("\nGenerating medical report...")
+        start = time.perf_counter()
+        medical_report = self.report_generator.generate_final_medical_report(
+            full_chat=full_chat,
+            chat_summary=final_summary,
+            retrieved_knowledge=retrieved_data  # Skip for now
+        )
+        timings["report"] = time.perf_counter() - start
+
+        return medical_report, self.store_result(session_id, full_chat, final_summary, retrieved_data, medical_report, timings)
+
+    def store_result(self, session_id, full_chat, final_summary, retrieved_data, medical_report, timings):
+        
+        # Store results
+        result = {
+            "session_id": session_id,
+            "full_chat": full_chat,
+            "clinical_summary": final_summary,
+            "retrieved_data": retrieved_data,
+            "medical_report": medical_report,
+            "timings": timings
+        }
+        self.session_results[session_id] = result
+        return result
+
+    def run_session(self, turns, session_id=None):
+        """
+        Non-interactive run_pipeline: feed scripted patient turns, then summarize, retrieve and report.
+
+        A STOP is sent after the last turn unless the conversation already ended. Returns the
+        result dict with per-stage timings in seconds (conversation, per turn, summary, retrieval, report).
+        """
+        session_id = session_id or str(uuid.uuid4())
+
+        start = time.perf_counter()
+        turn_seconds = []
+        full_chat = None
+        stop_chat = False
+        for user_input in turns:
+            turn_start = time.perf_counter()
+            _, stop_chat, full_chat = self.conversation_agent.chat(session_id, user_input)
+            turn_seconds.append(time.perf_counter() - turn_start)
+            if stop_chat:
+                break
+
+        if not stop_chat:
+            _, _, full_chat = self.conversation_agent.chat(session_id, "stop")
+        conversation_seconds = time.perf_counter() - start
+
+        if not full_chat:
+            raise ValueError("Transcript has no patient turns")
+
+        _, result = self.generate_report(session_id, full_chat)
+        self.conversation_agent.end_session(session_id)
+
+        result["timings"] = dict(result["timings"], conversation=conversation_seconds, turns=turn_seconds)
+        result["timings"]["total"] = time.perf_counter() - start
+        return result
+
+    def run_batch(self, transcripts, max_workers=4, output_path=None):
+        """
+        Run scripted transcripts ({"session_id"?, "turns": [...]}) as concurrent sessions.
+
+        Results (or the error of a failed session) are written to output_path as JSONL in
+        completion order; a per-stage timing summary is printed and returned.
+        """
+        def run(index, transcript):
+            session_id = transcript.get("session_id") or f"batch-{index}-{uuid.uuid4().hex[:8]}"
+            try:
+                return self.run_session(transcript["turns"], session_id=session_id)
+            except Exception as e:
+                return {"session_id": session_id, "error": f"{type(e).__name__}: {e}"}
+
+        start = time.perf_counter()
+        results = []
+        output = open(output_path, "w", encoding="utf-8") if output_path else None
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-session") as executor:
+                futures = [executor.submit(run, i, transcript) for i, transcript in enumerate(transcripts)]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    if output:
+                        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                        output.flush()
+        finally:
+            if output:
+                output.close()
+
+        summary = self.summarize_timings(results, time.perf_counter() - start)
+
+        print("\n" + "=" * 60)
+        print("BATCH SUMMARY")
+        print("=" * 60)
+        print(f"Sessions: {summary['sessions']} ok, {summary['errors']} failed in {summary['wall_seconds']:.1f}s "
+              f"({summary['sessions_per_sec']:.2f} sessions/sec, {max_workers} workers)")
+        for stage, stats in summary["stages"].items():
+            print(f"{stage:22s} p50 {stats['p50']:7.3f}s  p95 {stats['p95']:7.3f}s  max {stats['max']:7.3f}s")
+        get_telemetry().print_summary()
+
+        return results, summary
+
+    @staticmethod
+    def summarize_timings(results, wall_seconds):
+        """p50 / p95 / max per stage over the successful sessions."""
+        ok = [result for result in results if "error" not in result]
+
+        samples = {}
+        for result in ok:
+            for stage, seconds in result["timings"].items():
+                samples.setdefault(stage, []).extend(seconds if isinstance(seconds, list) else [seconds])
+
+        stages = {}
+        for stage, values in samples.items():
+            values = sorted(values)
+            stages[stage] = {
+                "p50": statistics.median(values),
+                "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+                "max": values[-1],
+            }
+
+        return {
+            "sessions": len(ok),
+            "errors": len(results) - len(ok),
+            "wall_seconds": wall_seconds,
+            "sessions_per_sec": len(ok) / wall_seconds if wall_seconds > 0 else 0.0,
+            "stages": stages,
+        }
+
     def save_report_to_file(self, result, filename=None):
         """Save report to JSON file"""
         if not filename:
@@ -108,8 +284,28 @@ class MedicalPipeline:
         
         print(f"Report saved to: {filename}")
 
+def load_transcripts(path):
+    """JSONL transcripts, one per line: {"session_id": optional, "turns": ["patient turn", ...]}."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
 # Standalone testing
 if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Medical assistant pipeline (interactive or batch)")
+    parser.add_argument("--batch", metavar="TRANSCRIPTS_JSONL", help="run scripted transcripts instead of input()")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_MAX_WORKERS", 4)))
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file for batch results")
+    parser.add_argument("--report-mode", choices=["two_call", "fused"], help="override REPORT_MODE")
+    args = parser.parse_args()
+
     pipeline = MedicalPipeline()
+    if args.report_mode:
+        pipeline.report_mode = args.report_mode
+
+    if args.batch:
+        results, summary = pipeline.run_batch(load_transcripts(args.batch), max_workers=args.workers, output_path=args.output)
+        print(f"Results saved to: {args.output}")
+        sys.exit(1 if summary["errors"] else 0)
     
     med_report, resp = pipeline.run_pipeline()
\ No newline at end of file
@@ -0,0 +1,33 @@
+from prompt_assembly import compact_transcript, drop_covered_turns, is_covered
+from lexical_search import tokenize
+
+
+def test_negated_turn_is_not_covered_by_positive_summary():
+    summary_terms = set(tokenize("Patient reports a headache and fever since Monday."))
+    assert not is_covered("no fever", summary_terms)
+    assert is_covered("a headache since Monday", summary_terms)
+
+
+def test_negated_answer_is_kept_with_its_question():
+    turns = [
+        ("Assistant", "Do you have a fever?"),
+        ("Patient", "no fever"),
+        ("Assistant", "Where is the pain?"),
+        ("Patient", "headache"),
+    ]
+    kept = drop_covered_turns(turns, "Headache. Fever reported.")
+    assert kept == turns[:2]
+
+
+def test_contentless_answer_keeps_the_exchange():
+    turns = [("Assistant", "Are you taking any medication?"), ("Patient", "yes")]
+    assert drop_covered_turns(turns, "Patient is taking medication.") == turns
+
+
+def test_unanswered_question_is_kept():
+    full_chat = [
+        {"HumanMessage": "I have a headache"},
+        {"AIMessage": "How long has it lasted?"},
+    ]
+    transcript = compact_transcript(full_chat, summary="Headache.")
+    assert transcript == "Assistant: How long has it lasted?"
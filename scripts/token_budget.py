@@ -0,0 +1,44 @@
+"""
+Cheap prompt-size estimates used to keep model calls under a token budget.
+
+Claude tokenizes English clinical text at roughly 3.5-4 characters per token; the estimate
+uses the low end so it errs high and budgets hold without calling a tokenizer on every turn.
+"""
+
+import math
+
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4  # role markers / separators per message
+
+
+def estimate_tokens(text) -> int:
+    """Estimated token count of a string (or of the text blocks of a content list)."""
+    if isinstance(text, list):
+        text = "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in text)
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(messages) -> int:
+    """Estimated prompt tokens of a list of chat messages."""
+    return sum(estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, marking the cut."""
+    max_chars = max(0, int(max_tokens * CHARS_PER_TOKEN))
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + " …[truncated]"
+
+
+def elide_to_tokens(text: str, max_tokens: int, head_share: float = 0.25) -> str:
+    """Cut text to roughly max_tokens by dropping its middle, keeping mostly the (most recent) tail."""
+    marker = " …[truncated]… "
+    max_chars = max(0, int(max_tokens * CHARS_PER_TOKEN) - len(marker))
+    if len(text) <= max_chars + len(marker):
+        return text
+    head_chars = int(max_chars * head_share)
+    tail_chars = max_chars - head_chars
+    return text[:head_chars].rstrip() + marker + (text[-tail_chars:].lstrip() if tail_chars else "")
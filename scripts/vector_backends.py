@@ -0,0 +1,408 @@
+import os
+import json
+import uuid
+import threading
+import numpy as np
+from opensearchpy import helpers
+
+from lexical_search import BM25Index, reciprocal_rank_fusion
+
+
+class SearchError(RuntimeError):
+    """A search the vector backend could not answer."""
+
+
+class OpenSearchBackend:
+    """
+    Vector backend storing documents in an OpenSearch k-NN index.
+    """
+    def __init__(self, client, index_name: str, index_body: dict):
+
+        self.client = client
+        self.index_name = index_name
+
+        if not self.client.indices.exists(index=self.index_name):
+            self.client.indices.create(index=self.index_name, body=index_body)
+
+    def add_documents(self, docs, ids=None, batch_size=500):
+        """Index documents through the _bulk API, returns the number indexed.
+
+        Documents with an explicit id overwrite any existing document with the same id.
+        """
+        actions = []
+        for i, doc in enumerate(docs):
+            action = {"_index": self.index_name, "_source": doc}
+            if ids is not None:
+                action["_id"] = ids[i]
+            actions.append(action)
+
+        success, _ = helpers.bulk(self.client, actions, chunk_size=batch_size)
+        return success
+
+    def delete_documents(self, ids, batch_size=500):
+        """Delete documents by id through the _bulk API, returns the number deleted."""
+        actions = [{"_op_type": "delete", "_index": self.index_name, "_id": doc_id} for doc_id in ids]
+
+        # ids that are already gone come back as 404 and are not an error here
+        success, _ = helpers.bulk(self.client, actions, chunk_size=batch_size, raise_on_error=False)
+        return success
+
+    def delete_by_source(self, source: str):
+        """Delete every document whose metadata.source matches, returns the number deleted."""
+        response = self.client.delete_by_query(
+            index=self.index_name,
+            body={"query": {"term": {"metadata.source": source}}}
+        )
+        return response.get("deleted", 0)
+
+    @staticmethod
+    def _knn_body(vector, k: int, include_vectors: bool = False):
+        query = {
+            "size": k,
+            "query": {
+                "knn": {
+                    "embedding": {
+                        "vector": vector,
+                        "k": k
+                    }
+                }
+            }
+        }
+        if not include_vectors:
+            query["_source"] = {"excludes": ["embedding"]}
+        return query
+
+    @staticmethod
+    def _match_body(text: str, k: int, include_vectors: bool = False):
+        query = {
+            "size": k,
+            "query": {
+                "match": {
+                    "combined_text": text
+                }
+            }
+        }
+        if not include_vectors:
+            query["_source"] = {"excludes": ["embedding"]}
+        return query
+
+    @staticmethod
+    def _error_reason(response):
+        # _msearch reports a failed sub-query in its own response, with HTTP 200 overall
+        error = response.get("error")
+        if error is None:
+            return None
+        return error.get("reason", error) if isinstance(error, dict) else error
+
+    @classmethod
+    def _fuse(cls, lexical, knn, k: int):
+        """Reciprocal rank fusion of the rankings that succeeded; one failed ranking degrades to the other."""
+        rankings = []
+        for name, response in (("BM25", lexical), ("k-NN", knn)):
+            reason = cls._error_reason(response)
+            if reason is None:
+                rankings.append(response["hits"]["hits"])
+            else:
+                print(f"=== BACKEND: {name} query failed, ranking without it: {reason} ===")
+        if not rankings:
+            raise SearchError(f"Hybrid search failed: {cls._error_reason(knn)}")
+
+        hits = reciprocal_rank_fusion(rankings, k=k)
+        return {"hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+    def knn_search(self, vector, k: int = 1, include_vectors: bool = False):
+        """Top-k nearest neighbours of a query vector, in OpenSearch response format."""
+        return self.client.search(index=self.index_name, body=self._knn_body(vector, k, include_vectors))
+
+    def lexical_search(self, text: str, k: int = 1):
+        """Top-k BM25 matches of the query text on combined_text."""
+        return self.client.search(index=self.index_name, body=self._match_body(text, k))
+
+    def hybrid_search(self, text: str, vector, k: int = 1, window: int = 20):
+        """
+        BM25 on combined_text and k-NN on embedding in one _msearch round-trip,
+        fused by reciprocal rank. window is the depth taken from each ranking.
+        """
+        window = max(k, window)
+        body = [
+            {"index": self.index_name}, self._match_body(text, window),
+            {"index": self.index_name}, self._knn_body(vector, window),
+        ]
+        lexical, knn = self.client.msearch(body=body)["responses"]
+        return self._fuse(lexical, knn, k)
+
+    def knn_search_many(self, vectors, k: int = 1):
+        """k-NN for several query vectors in a single _msearch request, one response per vector."""
+        if not vectors:
+            return []
+
+        body = []
+        for vector in vectors:
+            body.extend([{"index": self.index_name}, self._knn_body(vector, k)])
+
+        responses = self.client.msearch(body=body)["responses"]
+        for response in responses:
+            reason = self._error_reason(response)
+            if reason is not None:
+                raise SearchError(f"k-NN search failed: {reason}")
+        return responses
+
+    def hybrid_search_many(self, texts, vectors, k: int = 1, window: int = 20):
+        """hybrid_search for several queries, all BM25 and k-NN queries in a single _msearch request."""
+        if not texts:
+            return []
+
+        window = max(k, window)
+        body = []
+        for text, vector in zip(texts, vectors):
+            body.extend([{"index": self.index_name}, self._match_body(text, window)])
+            body.extend([{"index": self.index_name}, self._knn_body(vector, window)])
+
+        responses = self.client.msearch(body=body)["responses"]
+
+        return [self._fuse(lexical, knn, k) for lexical, knn in zip(responses[0::2], responses[1::2])]
+
+    def count(self):
+        return self.client.count(index=self.index_name)["count"]
+
+    def count_by_source(self, source: str):
+        """Number of documents whose metadata.source matches."""
+        body = {"query": {"term": {"metadata.source": source}}}
+        return self.client.count(index=self.index_name, body=body)["count"]
+
+    def refresh(self):
+        self.client.indices.refresh(index=self.index_name)
+
+    def flush(self):
+        pass  # every _bulk write is already durable
+
+
+class NumpyBackend:
+    """
+    In-process vector backend keeping every embedding in one contiguous float32 matrix.
+
+    Rows are L2-normalized on insert so cosine similarity is a single matrix-vector product.
+    When a storage path is given the matrix is persisted as .npy (optionally memory-mapped
+    on load) next to a JSON file holding the document ids and sources. Writes stay in memory
+    until flush(), so an ingestion rewrites the files once rather than once per batch.
+    """
+    def __init__(self, path: str = None, dimension: int = 1024, mmap: bool = False):
+
+        self.path = path
+        self.dimension = dimension
+
+        self.embeddings = np.empty((0, dimension), dtype=np.float32)
+        self.ids = []
+        self.sources = []
+        self.positions = {}
+        self.bm25 = BM25Index()
+        self._dirty = False  # in-memory changes not yet written by flush()
+
+        # shared process-wide, so writes (validated reports) must not interleave with searches
+        self._lock = threading.RLock()
+
+        if self.path and os.path.exists(self._matrix_file()):
+            self.embeddings = np.load(self._matrix_file(), mmap_mode="r" if mmap else None)
+            with open(self._documents_file(), "r", encoding="utf-8") as f:
+                documents = json.load(f)
+            self.ids = documents["ids"]
+            self.sources = documents["sources"]
+            self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+            for doc_id, source in zip(self.ids, self.sources):
+                self.bm25.add(doc_id, source.get("combined_text", ""))
+
+    def _matrix_file(self):
+        return os.path.join(self.path, "embeddings.npy")
+
+    def _documents_file(self):
+        return os.path.join(self.path, "documents.json")
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def add_documents(self, docs, ids=None, batch_size=None):
+        """Append documents to the matrix, returns the number indexed.
+
+        Documents whose id is already present overwrite the existing row in place.
+        """
+        with self._lock:
+            if not docs:
+                return 0
+
+            ids = ids if ids is not None else [str(uuid.uuid4()) for _ in docs]
+
+            vectors = np.asarray([doc["embedding"] for doc in docs], dtype=np.float32)
+            vectors = self._normalize(vectors)
+
+            # the embedding lives in the matrix, the source keeps only the text fields
+            sources = [{key: value for key, value in doc.items() if key != "embedding"} for doc in docs]
+
+            existing = [(i, self.positions[doc_id]) for i, doc_id in enumerate(ids) if doc_id in self.positions]
+            if existing:
+                self.embeddings = np.array(self.embeddings, dtype=np.float32)  # writable copy of a memory-map
+                for i, row in existing:
+                    self.embeddings[row] = vectors[i]
+                    self.sources[row] = sources[i]
+                    self.bm25.add(ids[i], sources[i].get("combined_text", ""))
+
+            new = [i for i, doc_id in enumerate(ids) if doc_id not in self.positions]
+            if new:
+                self.embeddings = np.vstack([self.embeddings, vectors[new]]).astype(np.float32, copy=False)
+                for i in new:
+                    self.positions[ids[i]] = len(self.ids)
+                    self.ids.append(ids[i])
+                    self.sources.append(sources[i])
+                    self.bm25.add(ids[i], sources[i].get("combined_text", ""))
+
+            self._dirty = True
+            return len(docs)
+
+    def _keep_rows(self, keep):
+        kept = set(keep)
+        for i, doc_id in enumerate(self.ids):
+            if i not in kept:
+                self.bm25.remove(doc_id)
+        self.embeddings = np.ascontiguousarray(self.embeddings[keep], dtype=np.float32)
+        self.ids = [self.ids[i] for i in keep]
+        self.sources = [self.sources[i] for i in keep]
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._dirty = True
+
+    def delete_documents(self, ids, batch_size=None):
+        """Drop rows by id, returns the number deleted."""
+        with self._lock:
+            drop = {self.positions[doc_id] for doc_id in ids if doc_id in self.positions}
+            if drop:
+                self._keep_rows([i for i in range(len(self.ids)) if i not in drop])
+            return len(drop)
+
+    def delete_by_source(self, source: str):
+        """Drop every row whose metadata.source matches, returns the number deleted."""
+        with self._lock:
+            keep = [i for i, doc in enumerate(self.sources) if doc.get("metadata", {}).get("source") != source]
+            deleted = len(self.ids) - len(keep)
+            if deleted:
+                self._keep_rows(keep)
+            return deleted
+
+    def knn_search(self, vector, k: int = 1, include_vectors: bool = False):
+        """Top-k rows by cosine similarity, in OpenSearch response format."""
+        with self._lock:
+            hits = []
+
+            if len(self.ids):
+                query = self._normalize(np.asarray(vector, dtype=np.float32))
+                scores = self.embeddings @ query
+
+                k = min(k, len(scores))
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+
+                for i in top:
+                    source = dict(self.sources[i])
+                    if include_vectors:
+                        source["embedding"] = self.embeddings[i].tolist()
+                    hits.append({"_id": self.ids[i], "_score": float(scores[i]), "_source": source})
+
+            return {"hits": {"total": {"value": len(self.ids)}, "hits": hits}}
+
+    def knn_search_many(self, vectors, k: int = 1):
+        """Top-k rows for several query vectors with one matrix-matrix product."""
+        if not len(vectors):
+            return []
+
+        with self._lock:
+            results = []
+            if not len(self.ids):
+                return [{"hits": {"total": {"value": 0}, "hits": []}} for _ in vectors]
+
+            queries = self._normalize(np.asarray(vectors, dtype=np.float32))
+            scores = queries @ self.embeddings.T
+
+            k = min(k, scores.shape[1])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+            for row, candidates in enumerate(top):
+                candidates = candidates[np.argsort(-scores[row, candidates])]
+                hits = [
+                    {"_id": self.ids[i], "_score": float(scores[row, i]), "_source": dict(self.sources[i])}
+                    for i in candidates
+                ]
+                results.append({"hits": {"total": {"value": len(self.ids)}, "hits": hits}})
+            return results
+
+    def lexical_search(self, text: str, k: int = 1):
+        """Top-k BM25 matches of the query text, in OpenSearch response format."""
+        with self._lock:
+            hits = [
+                {"_id": doc_id, "_score": score, "_source": dict(self.sources[self.positions[doc_id]])}
+                for doc_id, score in self.bm25.search(text, k)
+            ]
+            return {"hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+    def hybrid_search(self, text: str, vector, k: int = 1, window: int = 20):
+        """Local BM25 and cosine k-NN fused by reciprocal rank."""
+        window = max(k, window)
+        lexical = self.lexical_search(text, window)
+        knn = self.knn_search(vector, window)
+
+        hits = reciprocal_rank_fusion([lexical["hits"]["hits"], knn["hits"]["hits"]], k=k)
+        return {"hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+    def hybrid_search_many(self, texts, vectors, k: int = 1, window: int = 20):
+        window = max(k, window)
+        knn_responses = self.knn_search_many(vectors, window)
+
+        results = []
+        for text, knn in zip(texts, knn_responses):
+            lexical = self.lexical_search(text, window)
+            hits = reciprocal_rank_fusion([lexical["hits"]["hits"], knn["hits"]["hits"]], k=k)
+            results.append({"hits": {"total": {"value": len(hits)}, "hits": hits}})
+        return results
+
+    def count(self):
+        return len(self.ids)
+
+    def count_by_source(self, source: str):
+        with self._lock:
+            return sum(doc.get("metadata", {}).get("source") == source for doc in self.sources)
+
+    def refresh(self):
+        pass
+
+    def flush(self):
+        """Write pending changes to the storage path, if any."""
+        with self._lock:
+            if self._dirty:
+                self.save()
+                self._dirty = False
+
+    def save(self):
+        """Persist the matrix and documents when a storage path is configured."""
+        if not self.path:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        np.save(self._matrix_file(), np.ascontiguousarray(self.embeddings))
+        with open(self._documents_file(), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "sources": self.sources}, f, ensure_ascii=False)
+
+
+def create_vector_backend(backend: str = None, opensearch_client=None, index_name: str = None, index_body: dict = None):
+    """Build the vector backend selected by VECTOR_BACKEND ('opensearch' or 'numpy')."""
+    backend = (backend or os.getenv("VECTOR_BACKEND", "opensearch")).lower()
+
+    if backend == "opensearch":
+        return OpenSearchBackend(opensearch_client, index_name, index_body)
+
+    if backend == "numpy":
+        return NumpyBackend(
+            path=os.getenv("VECTOR_STORE_PATH", "/app/cache/vector_store"),
+            dimension=index_body["mappings"]["properties"]["embedding"]["dimension"],
+            mmap=os.getenv("VECTOR_STORE_MMAP", "false").lower() == "true",
+        )
+
+    raise ValueError(f"Unknown vector backend: {backend}")